@@ -3,8 +3,13 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.exception_handler import ExceptionHandler
+from utility.inventory import Inventory
+from utility.tag_engine import TagEngine
+from utility.application_index import ApplicationIndex
+from utility.project_write_buffer import ProjectWriteBuffer
 
 import os
 import sys
@@ -32,14 +37,6 @@ def clean_app_name(app_name):
 
     return cleanedName
 
-def check_checkmarx_app_exists_by_name(cx_app):
-
-    cx_app_name = ""
-    if "applications" in cx_app and cx_app["applications"]:
-        cx_app_name = cx_app["applications"][0].get("name", "")
-
-    return cx_app_name if cx_app_name else None
-
 def get_criticality_level(risk):
 
     criticalityMapping = {
@@ -61,9 +58,24 @@ def create_tags(project_code, lbu_name):
 
     return tags
 
-def main(filename):
+def report_project_writes(staged_projects, failed_project_ids, failed_projects):
+    # Projects are only reported as tagged once their PUT went through; the others are collected as failed
+    tagged_count = 0
+
+    for project_id, (project_name, tag) in staged_projects.items():
+        if project_id in failed_project_ids:
+            print(f"Error tagging project {project_name}: {failed_project_ids[project_id]}")
+            failed_projects.append(project_name)
+        else:
+            print(f"Tagged project {project_name}: {tag}")
+            tagged_count += 1
 
-    httpRequest = HttpRequests()
+    staged_projects.clear()
+    return tagged_count
+
+def main(filename, full_sync=False, rate=None, max_rate=None):
+
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -75,65 +87,86 @@ def main(filename):
     create_application_endpoint = routes.create_application()
     get_application_endpoint = routes.get_application()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
 
-    # Step 1: Retrieve all on-board projects and tag them accordingly
-    cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, empty_tag="false")
+    # Step 1: Retrieve all on-board projects and tag them accordingly.
+    # The inventory in ./state only fetches projects changed since the previous run when that directory is kept.
+    inventory = Inventory()
+    if not inventory.sync(api_actions, access_token, tenant_url, force=full_sync):
+        print("Failed to retrieve the Checkmarx projects.")
+        return
+    cx_projects = inventory.get_all_projects()
 
     prucore_filepath = f"./csv_files/prucore/{filename}"
 
-    project_codes = Csv.read_csv(prucore_filepath, column_index=0)
-    app_names = Csv.read_csv(prucore_filepath, column_index=1)
-    criticality = Csv.read_csv(prucore_filepath, column_index=2)
+    # Column headers differ between PruCore exports, so the columns are read by position in a single pass.
+    # Rows without a project code or an app name are left out, so each row keeps its own values together
+    prucore_rows = [row for row in Csv.iter_csv_rows(prucore_filepath, [0, 1, 2]) if row[0] and row[1]]
+    project_codes = [row[0] for row in prucore_rows]
+
+    # Parse every project name once and index the projects by the project code in their name,
+    # so each app below is matched with a dict lookup instead of a regex over all projects
+    projects_by_code = TagEngine(project_codes).index_projects_by_code(cx_projects)
+
+    # Existing applications are resolved from the inventory's application listing instead of one lookup per app
+    application_index = ApplicationIndex(inventory.get_all_applications())
 
     project_exists = False
 
+    project_write_buffer = ProjectWriteBuffer(api_actions, tenant_url)
+
+    # Staged project changes are sent every flush_every rows, so an interrupted run only loses the last few rows' changes
+    flush_every = 100
+
+    # Project ID -> (project name, tag) of the changes staged since the last flush
+    staged_projects = {}
+    failed_projects = []
+
+    unchanged_application_count = 0
+    application_write_count = 0
     newly_tagged_project_count = 0
     newly_tagged_application_count = 0
     newly_created_application_count = 0
 
     # Step 2: Create Applications and Tag projects in Checkmarx
-    for idx, app in enumerate(app_names):
+    for idx, (tag, app_name, crit) in enumerate(prucore_rows):
 
         # NOTE: app_name is equal to Project Name in PruCore
-        app_name, tag, crit = app_names[idx], project_codes[idx], criticality[idx]
-        criticality_level = get_criticality_level(crit)
+        criticality_level = get_criticality_level(crit or "")
         project_ids_grouped_by_tag = []
         lbu_name = "PRU"
 
-        # regex_pattern = r"^[\w\/\-\@]+(\-" + tag + r"\-)[\w]+"
-        regex_pattern = r"^[\w\-\/]+\/([\w]+)-(" + tag + r")-[\w\-]+"
-        for project in cx_projects:
+        # NOTE: If existing CX project does not have a tag on its name, it will not be tagged
+        for project in projects_by_code.get(tag.upper(), []):
             project_name = project.get("name")
             project_id = project.get("id")
             
             try:
-                # NOTE: If existing CX project does not have a tag on its name, it will not be tagged
-                if re.match(regex_pattern, project_name, re.IGNORECASE):
-                    print(f"{project_name} is regex matched!")
-                    tags = project.get("tags")
-                    lbu_name = HelperFunctions.get_lbu_name_simple(project_name)
-                    
-                    if not tags:
+                print(f"{project_name} is regex matched!")
+                tags = project.get("tags")
+                lbu_name = HelperFunctions.get_lbu_name_simple(project_name)
+                
+                if not tags:
 
-                        # Combine tags in a dict
-                        new_tags = create_tags(tag, lbu_name)
+                    # Combine tags in a dict
+                    new_tags = create_tags(tag, lbu_name)
 
-                        # Tagging the exisiting CX Project. This includes updating the criticality level of the project.
-                        print(f"Tagging project {project_name}")
+                    # Tagging the exisiting CX Project. This includes updating the criticality level of the project.
+                    print(f"Tagging project {project_name}")
 
-                        update_project_tags_and_criticality_endpoint = routes.update_projects(project_id)
-                        api_actions.update_project_tags_and_criticality(access_token, tenant_url, update_project_tags_and_criticality_endpoint, project, criticality_level, new_tags)
-                        
-                        print(f"Tagged project {project_name}: {tag}")
-                        newly_tagged_project_count += 1
+                    # Staged, not sent: all changes to a project are merged into one PUT when the buffer is flushed.
+                    # The local copy is updated right away, so later rows see the project as tagged.
+                    project["tags"] = {**(project.get("tags") or {}), **new_tags}
+                    project_write_buffer.stage(project, tags=project["tags"], criticality=criticality_level or project.get("criticality"))
+                    staged_projects[project_id] = (project_name, tag)
 
-                    else:
-                        print(f"Project {project_name} is already tagged.")
+                else:
+                    print(f"Project {project_name} is already tagged.")
 
-                    project_exists = True
-                    project_ids_grouped_by_tag.append(project_id)
+                project_exists = True
+                project_ids_grouped_by_tag.append(project_id)
 
             except Exception as e:
                 print(f"Error tagging project {project_name}: {e}")
@@ -143,16 +176,10 @@ def main(filename):
             '''Step 2b: Create Application on Checkmarx. Only those existing projects in CX with tag on its 
             name will be created with the equivalent application.'''
             generated_app_name = generate_checkmarx_app_name(lbu_name, app_name, tag)
-            cx_app = api_actions.get_application_by_name(access_token, tenant_url, get_application_endpoint, generated_app_name)
-
-            if not cx_app:
-                print(f"No response received for application: {generated_app_name}")
-                continue
-            
-            cx_app_exists = check_checkmarx_app_exists_by_name(cx_app)
+            cx_app = application_index.get(generated_app_name)
             new_tags = create_tags(tag, lbu_name)
             
-            if not cx_app_exists:
+            if not cx_app:
 
                 try:
                     app_created = api_actions.create_application(access_token, tenant_url, create_application_endpoint, 
@@ -163,29 +190,50 @@ def main(filename):
                     add_projects_to_application_endpoint = routes.add_projects_to_application(cx_app_id)
                     api_actions.add_projects_to_application(access_token, tenant_url, add_projects_to_application_endpoint, project_ids_grouped_by_tag)
 
+                    application_index.add({"id": cx_app_id, "name": generated_app_name, "tags": new_tags,
+                                           "criticality": criticality_level, "projectIds": project_ids_grouped_by_tag})
+
                     print(f"Sucessfully created application {generated_app_name}")
                     newly_created_application_count += 1
 
                 except Exception as e:
                     print(f"Error creating application {generated_app_name}: {e}")
 
+            elif application_index.is_up_to_date(generated_app_name, new_tags, criticality_level, project_ids_grouped_by_tag):
+                print(f"Application {generated_app_name} is up to date.")
+                unchanged_application_count += 1
+
             else:
                 try:
-                    cx_app_id = cx_app.get("applications", [{}])[0].get("id", "")
-                    cx_app_name = cx_app.get("applications", [{}])[0].get("name", "")
+                    cx_app_id = cx_app.get("id", "")
+                    cx_app_name = cx_app.get("name", "")
                     
                     print(f"Application {cx_app_name} exists")
 
-                    # Updating the application with the new project tag
-                    print(f"Tagging application {cx_app_name} with the new project tag...")
+                    # Tags and criticality are only written when one of them differs, and the projects
+                    # the application does not contain yet are the only ones added
+                    changes = application_index.diff(cx_app_name, new_tags, criticality_level, project_ids_grouped_by_tag)
 
-                    update_application_tags_and_criticality_endpoint = routes.update_application(cx_app_id)
-                    api_actions.update_application_tags_and_criticality(
-                        access_token, tenant_url, update_application_tags_and_criticality_endpoint, criticality_level, new_tags)
+                    if changes["tags"] is not None or changes["criticality"] is not None:
+                        print(f"Tagging application {cx_app_name} with the new project tag...")
+
+                        # The PUT replaces the application's tags and criticality, so both are always sent in full
+                        update_application_tags_and_criticality_endpoint = routes.update_application(cx_app_id)
+                        api_actions.update_application_tags_and_criticality(
+                            access_token, tenant_url, update_application_tags_and_criticality_endpoint, criticality_level, new_tags)
+
+                        application_index.update(cx_app_name, tags=new_tags, criticality=criticality_level)
+                        application_write_count += 1
                     
-                    # Direct Association: Add Project IDs to the Application
-                    add_projects_to_application_endpoint = routes.add_projects_to_application(cx_app_id)
-                    api_actions.add_projects_to_application(access_token, tenant_url, add_projects_to_application_endpoint, project_ids_grouped_by_tag)
+                    if changes["projectIds"]:
+                        print(f"Adding {len(changes['projectIds'])} projects to application {cx_app_name}...")
+
+                        # Direct Association: Add Project IDs to the Application
+                        add_projects_to_application_endpoint = routes.add_projects_to_application(cx_app_id)
+                        api_actions.add_projects_to_application(access_token, tenant_url, add_projects_to_application_endpoint, changes["projectIds"])
+
+                        application_index.add_projects(cx_app_name, changes["projectIds"])
+                        application_write_count += 1
 
                     print(f"Tagged application {cx_app_name} with the new project tag: {tag}")
                     newly_tagged_application_count += 1
@@ -195,18 +243,36 @@ def main(filename):
             
             project_exists = False
 
+        if (idx + 1) % flush_every == 0:
+            failed_project_ids = project_write_buffer.flush(token_manager.get_token())
+            newly_tagged_project_count += report_project_writes(staged_projects, failed_project_ids, failed_projects)
+
+    # Step 3: Send the project tag and criticality changes staged since the last flush, one PUT per project
+    failed_project_ids = project_write_buffer.flush(token_manager.get_token())
+    newly_tagged_project_count += report_project_writes(staged_projects, failed_project_ids, failed_projects)
+    project_write_buffer.log_stats()
+
     print("Onboarding pru core apps is complete.")
     print(f"Total Newly Tagged Projects: {newly_tagged_project_count}")
+    print(f"Total Projects Failed to Tag: {len(failed_projects)}")
     print(f"Total Tagged Applications: {newly_tagged_application_count}")
     print(f"Total Newly Created Applications: {newly_created_application_count}")
+    print(f"Total Unchanged Applications: {unchanged_application_count}")
+    print(f"Total Application Update Calls: {application_write_count}")
+
+    httpRequest.log_connection_stats()
+    api_actions.retry_policy.log_stats()
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Onboarding Prucore Apps')
     parser.add_argument('-filename', help='filename of the prucore apps',required=True)
+    parser.add_argument('-full_sync', help='download every project instead of only those changed since the last run', action='store_true')
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the main function with the provided exlusions and LBU
-    main(args.filename)
\ No newline at end of file
+    main(args.filename, args.full_sync, args.rate, args.max_rate)
\ No newline at end of file
@@ -3,9 +3,15 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.logger import Logger
 from utility.exception_handler import ExceptionHandler
+from utility.group_directory import GroupDirectory
+from utility.reconciler import Plan, Reconciler, MutationPipeline
+from utility.journal import Journal
+
+from concurrent.futures import ThreadPoolExecutor
 
 import os
 import sys
@@ -14,21 +20,45 @@ import re
 import time
 import json
 
-def assign_groups_to_resource(access_token, tenant_url, tenant_iam_url, tenant_name, groups, resource_id, resource_type, resource_name, routes, api_actions, logger):
-    
-    # Get route endpoints
-    get_access_token_endpoint = routes.get_access_token(tenant_name)
-    assign_group_to_resource_endpoint = routes.assign_group_to_resource()
-    
-    #access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+def load_existing_assignments(group_ids, tenant_url, routes, api_actions, logger, max_workers=4):
+    # One listing per group, so a re-run only sends the assignments that are missing.
+    # Groups whose assignments could not be listed add no pairs; their assignments are sent as before
+
+    existing_assignments = set()
+    endpoint = routes.get_entity_assignments()
+
+    def load(group_id):
+        return group_id, api_actions.get_entity_assignments(api_actions.token_manager.get_token(), tenant_url, endpoint, group_id)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for group_id, assignments in executor.map(load, dict.fromkeys(group_ids)):
+            if not isinstance(assignments, list):
+                print(f"Could not list the assignments of group {group_id}; all of its assignments will be sent")
+                logger.info(f"Could not list the assignments of group {group_id}; all of its assignments will be sent")
+                continue
+
+            for assignment in assignments:
+                resource_id = assignment.get("resourceID") or assignment.get("resourceId")
+                if resource_id:
+                    existing_assignments.add((group_id, resource_id))
+
+    print(f"Found {len(existing_assignments)} existing group assignments")
+    logger.info(f"Found {len(existing_assignments)} existing group assignments")
+
+    return existing_assignments
+
+def assign_groups_to_resource(groups, resource_id, resource_type, resource_name, reconciler, plan, logger, existing_assignments):
+    # Assignments are added to the plan of the current page; the pipeline sends them while the next page is fetched.
+    # Pairs already assigned, or already planned earlier in this run, are skipped
 
     for groupId in groups:
-        print(f"Creating Assignment for Group {groupId} for {resource_type} {resource_id} {resource_name}")
-        logger.info(f"Creating Assignment for Group {groupId} for {resource_type} {resource_id} {resource_name}")
-        #access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        assign_group_to_resource_response = api_actions.assign_group_to_resource(access_token, tenant_url, assign_group_to_resource_endpoint, groupId, resource_id, resource_type)
+        if reconciler.plan_group_assignment(plan, groupId, resource_id, resource_type, resource_name, existing=existing_assignments):
+            print(f"Planning Assignment for Group {groupId} for {resource_type} {resource_id} {resource_name}")
+            logger.info(f"Planning Assignment for Group {groupId} for {resource_type} {resource_id} {resource_name}")
 
-def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger):
+        existing_assignments.add((groupId, resource_id))
+
+def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger, group_directory, reconciler, pipeline, existing_assignments):
 
     tag_groups = {}
 
@@ -38,22 +68,20 @@ def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_l
     get_application_endpoint = routes.get_application()
     get_projects_endpoint = routes.get_projects()
 
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    access_token = api_actions.token_manager.get_token()
 
     for group in groups_list:
 
         print(f"Retrieving Id for Group {group}...")
         logger.info(f"Retrieving Id for Group {group}...")
         
-        get_group_response = api_actions.get_group(access_token, tenant_iam_url, get_groups_endpoint, group)
-        results = get_group_response
+        group_id = group_directory.get_group_id(group)
 
-        if not len(results):
+        if not group_id:
             print(f"{group} not found in Checkmarx! Skipping group assignment for {group}")
             logger.info(f"{group} not found in Checkmarx! Skipping group assignment for {group}")
             continue
 
-        group_id = results[0].get('id', '')
         tag = groups_dict[group].get("tag")
 
         print(f"{group} found! Adding {group} id {group_id} to tag group {tag}")
@@ -64,9 +92,6 @@ def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_l
 
         tag_groups[tag].append(group_id)
 
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
-
     for thistag, groups in tag_groups.items():
 
         print(f"Retrieving Application with {thistag} tag")
@@ -85,19 +110,21 @@ def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_l
 
         count = 1
         while apps_count > 0:
+            page_plan = Plan()
             for app in apps:
                 # print(count, app["id"], app["name"])
                 count += 1
-                assign_groups_to_resource(access_token, tenant_url, tenant_iam_url, tenant_name, groups, app["id"], 'application', app["name"], routes, api_actions, logger)
+                assign_groups_to_resource(groups, app["id"], 'application', app["name"], reconciler, page_plan, logger, existing_assignments)
+            pipeline.submit(f"Tag {thistag} applications", page_plan)
 
             apps_count -= limit
             offset += 100
 
             get_application_response = api_actions.get_application_by_tag(access_token, tenant_url, get_application_endpoint, thistag, offset, limit)
             apps = get_application_response.get("applications",[])
-        
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
+
+        pipeline.mark_done(f"Tag {thistag} applications")
+        access_token = api_actions.token_manager.get_token()
 
     for thistag, groups in tag_groups.items():
         
@@ -119,10 +146,12 @@ def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_l
         projects = results.get("projects", [])
         count = 1
         while projects_count > 0:
+            page_plan = Plan()
             for project in projects:
                 # print(count, project["id"], project["name"])
                 count += 1
-                assign_groups_to_resource(access_token, tenant_url, tenant_iam_url, tenant_name, groups, project["id"], "project", project["name"], routes, api_actions, logger)
+                assign_groups_to_resource(groups, project["id"], "project", project["name"], reconciler, page_plan, logger, existing_assignments)
+            pipeline.submit(f"Tag {thistag} projects", page_plan)
 
             projects_count -= limit
             offset += 100
@@ -130,11 +159,11 @@ def assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_l
             get_projects_by_tags_response = api_actions.get_projects_by_tags(access_token, tenant_url, get_projects_endpoint, thistag, offset, limit)
             results = get_projects_by_tags_response
             projects = results.get("projects", [])
-        
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
 
-def assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger):
+        pipeline.mark_done(f"Tag {thistag} projects")
+        access_token = api_actions.token_manager.get_token()
+
+def assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger, group_directory, reconciler, pipeline, existing_assignments):
 
     ghorg_groups = {}
     
@@ -145,19 +174,17 @@ def assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups
     get_projects_endpoint = routes.get_projects()
     get_projects_through_searchbar_endpoint = routes.get_projects_through_searchbar()
 
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    access_token = api_actions.token_manager.get_token()
 
     for group in groups_list:
         print(f"Retrieving Id for Group {group}...")
         logger.info(f"Retrieving Id for Group {group}...")
         
-        get_group_response = api_actions.get_group(access_token, tenant_iam_url, get_groups_endpoint, group)
-        results = get_group_response
-        if not len(results):
+        group_id = group_directory.get_group_id(group)
+        if not group_id:
             print(f"{group} not found in Checkmarx! Skipping group assignment for {group}")
             logger.info(f"{group} not found in Checkmarx! Skipping group assignment for {group}")
             continue
-        group_id = results[0].get('id', '')
         ghorg = groups_dict[group].get("tag")
         print(f"{group} found! Adding {group} id {group_id} to ghorg group {ghorg}")
         logger.info(f"{group} found! Adding {group} id {group_id} to ghorg group {ghorg}")
@@ -165,9 +192,6 @@ def assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups
             ghorg_groups[ghorg] = []
         ghorg_groups[ghorg].append(group_id)
 
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
-
     for thisghorg, groups in ghorg_groups.items():
         print(f"Retrieving Projects with {thisghorg} ghorg")
         logger.info(f"Retrieving Projects with {thisghorg} ghorg")
@@ -183,22 +207,28 @@ def assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups
         projects = results.get("projects", [])
         count = 1
         while projects_count > 0:
+            page_plan = Plan()
             for project in projects:
                 # print(count, project["projectId"], project["projectName"])
                 count += 1
-                assign_groups_to_resource(access_token, tenant_url, tenant_iam_url, tenant_name, groups, project["id"], "project", project["name"], routes, api_actions, logger)
+                assign_groups_to_resource(groups, project["id"], "project", project["name"], reconciler, page_plan, logger, existing_assignments)
+            pipeline.submit(f"GHOrg {thisghorg} projects", page_plan)
             projects_count -= limit
             offset += 100
             get_projects_through_searchbar_response = api_actions.get_projects_through_searchbar(access_token, tenant_url, get_projects_through_searchbar_endpoint, thisghorg, offset, limit)
             results = get_projects_through_searchbar_response
             projects = results.get("projects", [])
-        
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
 
-def main(filename, mode):
-    
-    httpRequest = HttpRequests()
+        pipeline.mark_done(f"GHOrg {thisghorg} projects")
+        access_token = api_actions.token_manager.get_token()
+
+def main(filename, mode, dry_run=False, max_workers=4, resume=False, rate=None, max_rate=None):
+
+    if mode not in ("tag", "GHOrg"):
+        print(f"{mode} is not a valid argument")
+        return
+
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -207,7 +237,8 @@ def main(filename, mode):
 
     routes = Routes()
 
-    api_actions = ApiActions(httpRequest)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, routes.get_access_token(tenant_name), logger=logger)
+    api_actions = ApiActions(httpRequest, logger=logger, token_manager=token_manager)
 
     groups_file_path = f"./csv_files/groups/{filename}"
 
@@ -216,23 +247,67 @@ def main(filename, mode):
     logger.info("Extracting list of group names from file")
     groups_list, groups_dict = HelperFunctions.get_groups_name_list(groups_file_path)
 
-    # Step 2: Assign groups to projects and applications
-    if mode == "tag":
-        assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger)
-    elif mode == "GHOrg":
-        assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger)
-    else:
-        print(f"{mode} is not a valid argument")
-        logger.error(f"{mode} is not a valid argument")
+    # Groups are listed once up front instead of one exact-search call per group
+    group_directory = GroupDirectory(api_actions, tenant_iam_url, routes.get_group(tenant_name), logger=logger)
+    if not group_directory.load(token_manager.get_token()):
+        return
+
+    # Existing assignments of the listed groups are loaded once, so only missing pairs are sent
+    group_ids = [group_directory.get_group_id(group) for group in groups_list if group in group_directory]
+    existing_assignments = load_existing_assignments(group_ids, tenant_url, routes, api_actions, logger, max_workers=max_workers)
+
+    # Sent assignments are journaled so that a failed run can be picked up again with -resume.
+    # A dry run only reads the journal
+    journal = None
+    if resume or not dry_run:
+        journal = Journal(f"checkmarx_group_assignment_{mode}", groups_file_path, resume=resume, logger=logger)
+
+    if resume:
+        existing_assignments.update(tuple(key.split("/", 1)) for key in journal)
+
+    def journal_assignment(mutation):
+        # Only a POST that succeeded is journaled; a failed one must be sent again by a resumed run.
+        # Assignment mutations are (base_url, endpoint, group ID, resource ID, resource type)
+        if mutation.applied and mutation.error is None:
+            journal.mark_done(f"{mutation.args[2]}/{mutation.target}")
+
+    reconciler = Reconciler(api_actions, tenant_url, max_workers=max_workers, logger=logger)
+
+    # Assignments of a page are sent, at most max_workers at a time, while the next page is fetched
+    pipeline = MutationPipeline(reconciler, max_workers=max_workers, dry_run=dry_run, logger=logger,
+                                on_applied=journal_assignment if not dry_run else None)
+
+    # Step 2: Assign groups to projects and applications. The journal is closed even if a step fails,
+    # so the assignments already sent are synced to disk for -resume
+    try:
+        if mode == "tag":
+            assign_group_by_tag(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger, group_directory, reconciler, pipeline, existing_assignments)
+        else:
+            assign_group_by_GHOrg(token, tenant_name, tenant_iam_url, tenant_url, groups_list, groups_dict, routes, api_actions, logger, group_directory, reconciler, pipeline, existing_assignments)
+
+    finally:
+        # Step 3: Wait for the assignments still in flight
+        results = pipeline.finish()
+
+        if journal:
+            journal.close()
+
+    print(f"Group assignment complete: {results['applied']} assignments sent, {results['failed']} failed, {results['unchanged']} already assigned")
+    logger.info(f"Group assignment complete: {results['applied']} assignments sent, {results['failed']} failed, {results['unchanged']} already assigned")
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Onboarding Prucore Apps')
     parser.add_argument('-filename', help='filename of the prucore apps',required=True)
     parser.add_argument('-mode', help='assignment mode by tag or by lbu',required=True)
+    parser.add_argument('-dry_run', help='print the planned assignments without applying them', action='store_true')
+    parser.add_argument('-max_workers', help='maximum assignments sent concurrently while the next page is fetched', type=int, default=4)
+    parser.add_argument('-resume', help='skip the assignments a previous run on the same file already sent', action='store_true')
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the main function with the provided exlusions and LBU
-    main(args.filename, args.mode)
+    main(args.filename, args.mode, args.dry_run, args.max_workers, args.resume, args.rate, args.max_rate)
@@ -3,9 +3,13 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.logger import Logger
 from utility.exception_handler import ExceptionHandler
+from utility.group_directory import GroupDirectory
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
 
 import os
 import sys
@@ -14,8 +18,8 @@ import re
 import time
 import json
 
-def main(filename):
-    httpRequest = HttpRequests()
+def main(filename, max_workers=8, rate=None, max_rate=None):
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -27,8 +31,9 @@ def main(filename):
     get_idps_endpoint = routes.get_idps(tenant_name)
     get_group_endpoint = routes.get_group(tenant_name)
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
 
     groups_file_path = f"./csv_files/groups/{filename}"
 
@@ -46,26 +51,69 @@ def main(filename):
     # Step 2: Create Mappers in CX IdP
     create_mapper_endpoint = routes.create_mapper(tenant_name, idp_alias)
     groups_list, groups_dict = HelperFunctions.get_groups_name_list(groups_file_path)
-    for group_name in groups_list:
-        print(f"Checking if {group_name} exists in CX...")
-        logger.info(f"Checking if {group_name} exists in CX...")
-        group_response = api_actions.get_group(access_token, tenant_iam_url, get_group_endpoint, group_name)
-        results = group_response
-        if not len(results):
+
+    # Groups are listed once up front instead of one exact-search call per group
+    group_directory = GroupDirectory(api_actions, tenant_iam_url, get_group_endpoint, logger=logger)
+    if not group_directory.load(access_token):
+        return
+
+    # Step 3: List the IdP's existing mappers once and keep only the groups that do not have one yet
+    get_mappers_response = api_actions.get_mappers(access_token, tenant_iam_url, routes.get_mappers(tenant_name, idp_alias))
+    if get_mappers_response is None:
+        print(f"Failed to retrieve the existing mappers on {idp_alias}")
+        logger.error(f"Failed to retrieve the existing mappers on {idp_alias}")
+        return
+    existing_mappers = {mapper.get("name") for mapper in get_mappers_response}
+
+    missing_groups = []
+    for group_name in dict.fromkeys(groups_list):
+        if group_name not in group_directory:
             print(f"{group_name} not found in CX! Skipping mapper creation for group.")
             logger.info(f"{group_name} not found in CX! Skipping mapper creation for group.")
-            continue
-        print(f"{group_name} found! Creating Mapper on {idp_alias}")
-        logger.info(f"{group_name} found! Creating Mapper on {idp_alias}")
-        create_mapper_response = api_actions.create_mapper(access_token, tenant_iam_url, create_mapper_endpoint, group_name, idp_alias)
+        elif group_name in existing_mappers:
+            print(f"{group_name} already has a mapper on {idp_alias}. Skipping.")
+            logger.info(f"{group_name} already has a mapper on {idp_alias}. Skipping.")
+        else:
+            missing_groups.append(group_name)
+
+    print(f"{len(missing_groups)} mappers to create on {idp_alias} ({len(existing_mappers)} already exist)")
+    logger.info(f"{len(missing_groups)} mappers to create on {idp_alias} ({len(existing_mappers)} already exist)")
+
+    # Step 4: Create the missing mappers, at most max_workers at a time
+    def create_mapper(group_name):
+        return api_actions.create_mapper(token_manager.get_token(), tenant_iam_url, create_mapper_endpoint, group_name, idp_alias)
+
+    created_count = 0
+    failed_count = 0
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {executor.submit(create_mapper, group_name): group_name for group_name in missing_groups}
+
+        for future in as_completed(futures):
+            group_name = futures[future]
+
+            if future.result() is None:
+                print(f"Failed to create Mapper for {group_name} on {idp_alias}")
+                logger.error(f"Failed to create Mapper for {group_name} on {idp_alias}")
+                failed_count += 1
+            else:
+                print(f"Created Mapper for {group_name} on {idp_alias}")
+                logger.info(f"Created Mapper for {group_name} on {idp_alias}")
+                created_count += 1
+
+    print(f"Mapper creation complete: {created_count} created, {failed_count} failed")
+    logger.info(f"Mapper creation complete: {created_count} created, {failed_count} failed")
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Onboarding Groups')
     parser.add_argument('-filename', help='filename of the prucore apps',required=True)
+    parser.add_argument('-max_workers', help='maximum mappers created concurrently', type=int, default=8)
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
     
     # Parse the command-line arguments
     args = parser.parse_args()
     
     # Call the main function with the provided exlusions and LBU
-    main(args.filename)
+    main(args.filename, args.max_workers, args.rate, args.max_rate)
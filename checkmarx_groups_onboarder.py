@@ -3,9 +3,11 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.logger import Logger
 from utility.exception_handler import ExceptionHandler
+from utility.group_directory import GroupDirectory
 
 import os
 import sys
@@ -14,8 +16,97 @@ import re
 import time
 import json
 
-def main(filename):
-  httpRequest = HttpRequests()
+def provision_groups_bulk(tenant_name, tenant_iam_url, groups_list, groups_dict, group_directory, client_id, roleids_dict, routes, api_actions, logger, chunk_size=500):
+  # Missing groups are created together with their ast-app role mapping through partial imports of chunk_size groups each.
+  # Groups that already exist only get the role mapping they lack, one call per group.
+
+  partial_import_endpoint = routes.partial_import(tenant_name)
+  results = {"ADDED": 0, "SKIPPED": 0, "FAILED": 0, "MAPPED": 0, "MAPPING_FAILED": 0}
+
+  missing_groups = []
+  unmapped_groups = []
+  for group in dict.fromkeys(groups_list):
+    role = groups_dict[group].get("role", "")
+    if role not in roleids_dict:
+      print(f"{group}: unknown role {role}. Skipping group.")
+      logger.error(f"{group}: unknown role {role}. Skipping group.")
+      results["FAILED"] += 1
+    elif group not in group_directory:
+      missing_groups.append(group)
+    elif not group_directory.has_client_role(group, role):
+      unmapped_groups.append(group)
+
+  print(f"{len(missing_groups)} groups to create, {len(unmapped_groups)} existing groups to role-map")
+  logger.info(f"{len(missing_groups)} groups to create, {len(unmapped_groups)} existing groups to role-map")
+
+  for start in range(0, len(missing_groups), chunk_size):
+    chunk = missing_groups[start:start + chunk_size]
+    document = [{"name": group, "clientRoles": {"ast-app": [groups_dict[group].get("role")]}} for group in chunk]
+
+    print(f"Importing groups {start + 1}-{start + len(chunk)} of {len(missing_groups)}...")
+    logger.info(f"Importing groups {start + 1}-{start + len(chunk)} of {len(missing_groups)}...")
+    access_token = api_actions.token_manager.get_token()
+    import_response = api_actions.partial_import(access_token, tenant_iam_url, partial_import_endpoint, document)
+
+    if import_response is None:
+      for group in chunk:
+        print(f"{group}: FAILED (partial import request failed)")
+        logger.error(f"{group}: FAILED (partial import request failed)")
+      results["FAILED"] += len(chunk)
+      continue
+
+    reported = set()
+    for result in import_response.get("results", []):
+      if result.get("resourceType") != "GROUP":
+        continue
+
+      group, action, group_id = result.get("resourceName"), result.get("action"), result.get("id")
+      reported.add(group)
+
+      if action == "ADDED":
+        group_directory.add_group(group, group_id)
+        group_directory.add_client_role(group, groups_dict.get(group, {}).get("role"))
+
+      print(f"{group}: {action} (id: {group_id})")
+      logger.info(f"{group}: {action} (id: {group_id})")
+      results[action if action in results else "FAILED"] += 1
+
+    for group in chunk:
+      if group not in reported:
+        print(f"{group}: FAILED (not reported by the partial import)")
+        logger.error(f"{group}: FAILED (not reported by the partial import)")
+        results["FAILED"] += 1
+
+  for group in unmapped_groups:
+    role = groups_dict[group].get("role")
+    group_id = group_directory.get_group_id(group)
+    assign_group_role_endpoint = routes.assign_group_role(tenant_name, group_id, client_id)
+
+    print(f"Performing role-mapping to {group}")
+    logger.info(f"Performing role-mapping to {group}")
+    access_token = api_actions.token_manager.get_token()
+
+    # assign_group_role returns None on failure and on success alike, so it is asked to raise instead
+    try:
+      api_actions.assign_group_role(access_token, tenant_iam_url, assign_group_role_endpoint, roleids_dict[role], role, raise_errors=True)
+    except Exception as e:
+      print(f"{group}: role-mapping FAILED ({e})")
+      logger.error(f"{group}: role-mapping FAILED ({e})")
+      results["MAPPING_FAILED"] += 1
+      continue
+
+    group_directory.add_client_role(group, role)
+    results["MAPPED"] += 1
+
+  print(f"Bulk group provisioning complete: {results['ADDED']} created, {results['SKIPPED']} skipped, {results['MAPPED']} role-mapped, "
+        f"{results['FAILED']} failed, {results['MAPPING_FAILED']} role-mappings failed")
+  logger.info(f"Bulk group provisioning complete: {results['ADDED']} created, {results['SKIPPED']} skipped, {results['MAPPED']} role-mapped, "
+              f"{results['FAILED']} failed, {results['MAPPING_FAILED']} role-mappings failed")
+
+  return results
+
+def main(filename, bulk=False, chunk_size=500, rate=None, max_rate=None):
+  httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
   config = Config()
   token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -26,8 +117,9 @@ def main(filename):
   get_access_token_endpoint = routes.get_access_token(tenant_name)
   get_client_id_endpoint = routes.get_client(tenant_name)
 
-  api_actions = ApiActions(httpRequest)
-  access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+  token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+  api_actions = ApiActions(httpRequest, token_manager=token_manager)
+  access_token = token_manager.get_token()
 
   # Step 1: Get list of groups to be created
   print("Extracting list of group names from file")
@@ -52,16 +144,23 @@ def main(filename):
     roleids_dict[role] = role_id
 
   # Step 4: Create the groups
-  # Step 4a: Check if group exist
+  # Step 4a: Check if group exist, against the groups listed once up front
   get_group_endpoint = routes.get_group(tenant_name)
+  group_directory = GroupDirectory(api_actions, tenant_iam_url, get_group_endpoint, logger=logger)
+  if not group_directory.load(access_token):
+    return
+
+  if bulk:
+    provision_groups_bulk(tenant_name, tenant_iam_url, groups_list, groups_dict, group_directory, client_id, roleids_dict, routes, api_actions, logger, chunk_size)
+    return
+
+  failed_role_mappings = []
+
   for count, group in enumerate(groups_list):
     print(f"Checking if {group} exists...")
     logger.info(f"Checking if {group} exists...")
-    group_response = api_actions.get_group(access_token, tenant_iam_url, get_group_endpoint, group)
-    results = group_response
-    group_id = ""
-    if len(results):
-      group_id = results[0].get("id")
+    group_id = group_directory.get_group_id(group)
+    if group_id:
       print(f"{group} already exists! Group ID: {group_id}")
       logger.info(f"{group} already exists! Group ID: {group_id}")
     else:
@@ -69,29 +168,56 @@ def main(filename):
       create_group_endpoint = routes.create_group(tenant_name)
       print(f"{group} not found! Proceeding to create group...")
       logger.info(f"{group} not found! Proceeding to create group...")
+      access_token = token_manager.get_token()
       group_creation_response = api_actions.create_group(access_token, tenant_iam_url, create_group_endpoint, group)
-      print(group_creation_response)
-      print(group_creation_response.headers)
+      if group_creation_response is None:
+        print(f"Failed to create {group}. Skipping role-mapping.")
+        logger.error(f"Failed to create {group}. Skipping role-mapping.")
+        continue
       group_id = group_creation_response.headers['Location'].split('/')[-1]
+      group_directory.add_group(group, group_id)
       print(f"{group} created with id: {group_id}")
       logger.info(f"{group} created with id: {group_id}")
 
-  # Step 4c: Perform role mapping to group
+  # Step 4c: Perform role mapping to group, unless the group already has the role
     role = groups_dict[group].get("role", "")
     role_id = roleids_dict[role]
+    if group_directory.has_client_role(group, role):
+      print(f"{group} already has the {role} role. Skipping role-mapping.")
+      logger.info(f"{group} already has the {role} role. Skipping role-mapping.")
+      continue
     assign_group_role_endpoint = routes.assign_group_role(tenant_name, group_id, client_id)
     print(f"Performing role-mapping to {group}")
     logger.info(f"Performing role-mapping to {group}")
     print(f"https://{tenant_iam_url}{assign_group_role_endpoint}")
-    assign_group_role_response = api_actions.assign_group_role(access_token, tenant_iam_url, assign_group_role_endpoint, role_id, role) 
+    access_token = token_manager.get_token()
+
+    # assign_group_role returns None on failure and on success alike, so it is asked to raise instead
+    try:
+      api_actions.assign_group_role(access_token, tenant_iam_url, assign_group_role_endpoint, role_id, role, raise_errors=True)
+    except Exception as e:
+      print(f"Failed role-mapping of {group}: {e}")
+      logger.error(f"Failed role-mapping of {group}: {e}")
+      failed_role_mappings.append(group)
+      continue
+
+    group_directory.add_client_role(group, role)
+
+  if failed_role_mappings:
+    print(f"Role-mapping failed for {len(failed_role_mappings)} groups: {', '.join(failed_role_mappings)}")
+    logger.error(f"Role-mapping failed for {len(failed_role_mappings)} groups: {', '.join(failed_role_mappings)}")
 
 if __name__ == "__main__":
   # Define command-line arguments
   parser = argparse.ArgumentParser(description='Onboarding Groups')
   parser.add_argument('-filename', help='filename of the groups',required=True)
+  parser.add_argument('-bulk', help='create missing groups and their role mappings through realm partial imports', action='store_true')
+  parser.add_argument('-chunk_size', help='groups per partial import when -bulk is set', type=int, default=500)
+  parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+  parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
   # Parse the command-line arguments
   args = parser.parse_args()
 
   # Call the main function with the provided exlusions and LBU
-  main(args.filename)
+  main(args.filename, args.bulk, args.chunk_size, args.rate, args.max_rate)
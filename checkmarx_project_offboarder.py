@@ -3,18 +3,46 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.logger import Logger
 from utility.exception_handler import ExceptionHandler
+from utility.inventory import Inventory
+from utility.reconciler import Plan, Reconciler
 
 import os
 import sys
 import argparse
 import re
 
-def main(filename):
+def resolve_live_project(api_actions, token, tenant_url, inventory, project_name, logger):
+    """
+    Resolve the project to delete against the tenant itself. The inventory may be hours old, so the
+    ID it returns is re-read live and only used if the project still has that name; otherwise the
+    name is looked up live. Returns the live project, or None if no project has that name.
+    """
 
-    httpRequest = HttpRequests()
+    routes = Routes()
+    cx_projects = inventory.resolve_projects_by_name(api_actions, token, tenant_url, project_name)
+
+    if cx_projects and cx_projects[0].get("id"):
+        live_project = api_actions.get_project_by_id(token, tenant_url, routes.get_project(cx_projects[0].get("id")))
+
+        if live_project and (live_project.get("name") or "").lower() == project_name.lower():
+            return live_project
+
+        logger.info(f"Inventory entry for {project_name} is out of date; looking the project up by name")
+
+    live_projects = api_actions.get_checkmarx_projects(token, tenant_url, routes.get_checkmarx_projects(), project_name=project_name)
+    if not live_projects:
+        return None
+
+    inventory.upsert_projects(live_projects)
+    return live_projects[0]
+
+def main(filename, inventory_ttl=6 * 3600, refresh_inventory=False, dry_run=False, max_workers=4, rate=None, max_rate=None):
+
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -25,12 +53,21 @@ def main(filename):
     get_access_token_endpoint = routes.get_access_token(tenant_name)
     get_checkmarx_projects_endpoint = routes.get_checkmarx_projects()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
+
+    # Project names are resolved against the local inventory instead of one name-regex query per row
+    inventory = Inventory(ttl=inventory_ttl, logger=logger)
+    inventory.refresh(api_actions, access_token, tenant_url, force=refresh_inventory)
 
     prucore_filepath = f"./csv_files/project_offboarding/{filename}"
     project_names_to_delete = Csv.read_csv(prucore_filepath, column_index=0)
 
+    reconciler = Reconciler(api_actions, tenant_url, max_workers=max_workers, logger=logger)
+    plan = Plan()
+    planned_project_ids = set()
+
     # Tracking counters
     project_deleted_count = 0
     project_failed_delete_count = 0
@@ -40,15 +77,17 @@ def main(filename):
     for project_name_to_delete in project_names_to_delete:
 
         try: 
-            cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, project_name=project_name_to_delete)
+            access_token = token_manager.get_token()
 
-            if not cx_projects:
+            # Deletes are never planned from the cached copy alone
+            cx_project = resolve_live_project(api_actions, access_token, tenant_url, inventory, project_name_to_delete, logger)
+
+            if not cx_project:
                 logger.error(f"No Checkmarx project found for {project_name_to_delete}")
                 project_failed_delete_count += 1
                 failed_projects.append(project_name_to_delete)
                 continue
 
-            cx_project = cx_projects[0]
             project_id = cx_project.get("id")
 
             if not project_id:
@@ -57,15 +96,14 @@ def main(filename):
                 failed_projects.append(project_name_to_delete)
                 continue
 
-            print(f"Removing project {project_name_to_delete}...")
-            logger.info(f"Removing project {project_name_to_delete}...")
-
-            delete_checkmarx_project_endpoint = routes.delete_project(project_id)
-            delete_project_response = api_actions.delete_checkmarx_project(access_token, tenant_url, delete_checkmarx_project_endpoint)
-            project_deleted_count += 1
+            # The same project listed twice in the CSV is deleted once
+            if project_id in planned_project_ids:
+                continue
+            planned_project_ids.add(project_id)
 
-            print(f"Project {project_name_to_delete} removed.")
-            logger.info(f"Project {project_name_to_delete} removed.")
+            print(f"Project {project_name_to_delete} will be removed.")
+            logger.info(f"Project {project_name_to_delete} will be removed.")
+            reconciler.plan_project_delete(plan, cx_project)
 
         except Exception as e:
             logger.error(f"Error processing {project_name_to_delete}: {e}")
@@ -77,6 +115,19 @@ def main(filename):
             failed_projects.append(project_name_to_delete)
             project_failed_delete_count += 1
 
+    # Send the planned deletes, at most max_workers at a time
+    results = reconciler.apply(plan, dry_run=dry_run)
+    project_deleted_count += results["applied"]
+    project_failed_delete_count += results["failed"]
+
+    for mutation in plan.mutations:
+        if mutation.applied:
+            inventory.remove_project(mutation.target)
+            print(f"Project {mutation.name} removed.")
+            logger.info(f"Project {mutation.name} removed.")
+        elif mutation.error:
+            failed_projects.append(mutation.name)
+
     logger.info("Offboarding projects is completed.")
     logger.info(f"Total Offboarded Projects: {project_deleted_count}")
     logger.info(f"Total Project failed to remove: {project_failed_delete_count}")
@@ -85,15 +136,24 @@ def main(filename):
     print(f"Total Offboarded Projects: {project_deleted_count}")
     print(f"Total Project failed to remove: {project_failed_delete_count}")
 
+    httpRequest.log_connection_stats(logger)
+    api_actions.retry_policy.log_stats(logger)
+
     print(f"Logs available here {logger.get_log_file_path()}")
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Offboarding CX project ')
     parser.add_argument('-filename', help='filename of the CX projects to be deleted',required=True)
+    parser.add_argument('-inventory_ttl', help='seconds a local tenant inventory stays valid before it is downloaded again', type=int, default=6 * 3600)
+    parser.add_argument('-refresh_inventory', help='download the tenant inventory even if the local copy is still valid', action='store_true')
+    parser.add_argument('-dry_run', help='print the planned deletes without applying them', action='store_true')
+    parser.add_argument('-max_workers', help='maximum deletes sent concurrently', type=int, default=4)
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the main function with the provided exlusions and LBU
-    main(args.filename)
\ No newline at end of file
+    main(args.filename, args.inventory_ttl, args.refresh_inventory, args.dry_run, args.max_workers, args.rate, args.max_rate)
\ No newline at end of file
@@ -3,8 +3,12 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.exception_handler import ExceptionHandler
+from utility.reconciler import Plan, Reconciler
+
+from itertools import islice
 
 import os
 import sys
@@ -13,9 +17,9 @@ import re
 import time
 import json
 
-def main():
+def main(dry_run=False, max_workers=4, rate=None, max_rate=None):
 
-    httpRequest = HttpRequests()
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -24,10 +28,13 @@ def main():
     get_access_token_endpoint = routes.get_access_token(tenant_name)
     get_checkmarx_projects_endpoint = routes.get_checkmarx_projects()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
+
+    cx_projects = api_actions.iter_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, empty_tag="false")
 
-    cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, empty_tag="false")
+    reconciler = Reconciler(api_actions, tenant_url, max_workers=max_workers)
 
     # Tracking counters
     project_success_update_count = 0
@@ -37,13 +44,30 @@ def main():
     repos_missing_default_branch = []
 
     batch_size = 100
-    batch_timeout = 60
 
-    for i in range(0, len(cx_projects), batch_size):
-        batch = cx_projects[i:i + batch_size]
+    # Batches are taken from the project stream and applied one by one, so updates start before the whole tenant is listed
+    listing_failed = False
+
+    while not listing_failed:
+        batch = []
+
+        try:
+            batch.extend(islice(cx_projects, batch_size))
+        except Exception as e:
+            # The projects already listed are still processed, then the run stops and reports the failure
+            print(f"Failed to list the tenant's projects: {e}")
+            listing_failed = True
+
+        if not batch:
+            break
+
+        plan = Plan()
 
         for cx_project in batch:
-            
+
+            # Picks up the TokenManager's refreshed token, if it has been renewed
+            access_token = token_manager.get_token()
+
             try: 
                 project_id = cx_project.get("id")
                 project_name = cx_project.get("name")
@@ -77,16 +101,12 @@ def main():
                     print("Failed to retrieve repository branches or unexpected response format.")
                     continue
 
-                if primary_branch == project_main_branch:
+                # Planned only if the project's primary branch differs; the batch's updates are sent together
+                if not reconciler.plan_primary_branch(plan, cx_project, primary_branch):
                     print(f"Project {project_name}'s primary branch has already been configured to {primary_branch}.")
                     continue
 
-                # Update the primary branch
-                update_project_primary_branch_endpoint = routes.update_projects(project_id)
-                api_actions.update_project_primary_branch(access_token, tenant_url, update_project_primary_branch_endpoint, cx_project, primary_branch)
-                project_success_update_count += 1
-
-                print(f"Project {project_name}'s primary branch has been set to {primary_branch}.")
+                print(f"Project {project_name}'s primary branch will be set to {primary_branch}.")
 
             except Exception as e:
                 print(f"Error processing {project_name}: {e}")
@@ -94,23 +114,40 @@ def main():
                 failed_projects.append(project_name)
                 project_failed_update_count += 1
 
-        # Renew access token after processing a batch
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
+        results = reconciler.apply(plan, dry_run=dry_run)
+        project_success_update_count += results["applied"]
+        project_failed_update_count += results["failed"]
 
-        if i + batch_size < len(cx_projects):  # Avoid sleeping after the last batch
-            print(f"Processed {i + batch_size} projects. Waiting {batch_timeout} seconds before the next batch...")
-            time.sleep(batch_timeout)  # Wait before processing the next batch
+        for mutation in plan.mutations:
+            if mutation.error:
+                failed_projects.append(mutation.name)
 
     print("Setting up Primary branch for the projects is completed.")
     print(f"Total Updated Projects: {project_success_update_count}")
     print(f"Total Project failed to update: {project_failed_update_count}")
 
+    httpRequest.log_connection_stats()
+    api_actions.retry_policy.log_stats()
+
     # Print repos withouth main or master branch
     if repos_missing_default_branch:
         print("Repositories skipped due to missing 'main' or 'master' branches:")
         for repo in repos_missing_default_branch:
             print(f" - {repo}")
 
+    if listing_failed:
+        print("The project listing failed part way; only the projects listed before the failure were processed.")
+        sys.exit(1)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Define command-line arguments
+    parser = argparse.ArgumentParser(description='Set the primary branch of the projects')
+    parser.add_argument('-dry_run', help='print the planned primary branch changes without applying them', action='store_true')
+    parser.add_argument('-max_workers', help='maximum primary branch updates sent concurrently', type=int, default=4)
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
+
+    # Parse the command-line arguments
+    args = parser.parse_args()
+
+    main(args.dry_run, args.max_workers, args.rate, args.max_rate)
\ No newline at end of file
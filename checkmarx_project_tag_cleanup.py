@@ -3,9 +3,14 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.helper_functions import HelperFunctions
 from utility.exception_handler import ExceptionHandler
 from utility.json_file_utility import JSONFile
+from utility.tag_engine import TagEngine
+from utility.reconciler import Plan, Reconciler
+
+from itertools import islice
 
 import os
 import sys
@@ -14,9 +19,9 @@ import re
 import time
 import json
 
-def main(filename):
+def main(filename, dry_run=False, max_workers=4, rate=None, max_rate=None):
 
-    httpRequest = HttpRequests()
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -28,9 +33,10 @@ def main(filename):
     create_application_endpoint = routes.create_application()
     get_application_endpoint = routes.get_application()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-    cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, empty_tag="false")
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
+    cx_projects = api_actions.iter_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, empty_tag="false")
 
     prucore_filepath = f"./csv_files/prucore/{filename}"
 
@@ -38,91 +44,68 @@ def main(filename):
     user_defined_tags_data = JSONFile.read_json_file("user_defined_tags.json")
     user_defined_tags_list = user_defined_tags_data.get("valid_tags", [])
 
-    project_codes_set = {code.upper() for code in project_codes}
-    user_defined_tags_set = {t.upper() for t in user_defined_tags_list}
+    tag_engine = TagEngine(project_codes, user_defined_tags_list)
+
+    reconciler = Reconciler(api_actions, tenant_url, max_workers=max_workers)
 
     project_tag_fixed = 0
     project_tag_failed = 0
+    project_tag_unchanged = 0
 
     batch_size = 100
-    batch_timeout = 60
-
-    for i in range(0, len(cx_projects), batch_size):
-        batch = cx_projects[i:i + batch_size]  # Get the next batch of batch_size
-
-        for cx_project in batch:
-            project_id = cx_project.get("id")
-            project_name = cx_project.get("name")
-            project_tags = cx_project.get("tags", {})
-            project_criticality = cx_project.get("criticality")
-            lbu_name = HelperFunctions.get_lbu_name_simple(project_name).upper()
-
-            correct_project_tag_dict = {}
-            project_using_user_defined_tag = False
-
-            for code in project_codes_set:
-
-                # Get the correct tags
-                regex_pattern = r"^[\w\-\/]+\/([\w]+)-(" + code + r")-[\w\-]+"
-
-                if re.match(regex_pattern, project_name, re.IGNORECASE):
-                    print(f"{project_name} is regex matched! {code}")
 
-                    correct_project_tag_dict[code] = ""
-                    correct_project_tag_dict[lbu_name] = ""
+    # Batches are taken from the project stream, so tagging starts before the whole tenant is listed
+    listing_failed = False
 
-            for code in user_defined_tags_set:
-                if code in project_tags:
-                    print(f"{project_name} user defined code is valid {code}")
+    while not listing_failed:
+        batch = []
 
-                    correct_project_tag_dict[code] = ""
-                    correct_project_tag_dict[lbu_name] = ""
+        try:
+            batch.extend(islice(cx_projects, batch_size))
+        except Exception as e:
+            # The projects already listed are still processed, then the run stops and reports the failure
+            print(f"Failed to list the tenant's projects: {e}")
+            listing_failed = True
 
-                    project_using_user_defined_tag = True
+        if not batch:
+            break
 
-            if not correct_project_tag_dict:
-                print(f"Need to assign fallback code and LBU name tags to {project_name}")
+        # Each project name is parsed once and matched against the project codes with set lookups
+        desired_tags = tag_engine.compute_all(batch)
 
-                correct_project_tag_dict["PRU"] = ""
-                correct_project_tag_dict[lbu_name] = ""
-
-            try:
-                print(f"Correct tags for {project_name}: {correct_project_tag_dict}")
-
-                if project_tags != correct_project_tag_dict:
-
-                    replace_project_tagsendpoint = routes.update_projects(project_id)
-                    api_actions.replace_project_tags(access_token, tenant_url, replace_project_tagsendpoint, cx_project, correct_project_tag_dict)
-
-                    print(f"Tags for {project_name} have been replaced with: {correct_project_tag_dict}")
-                    project_tag_fixed += 1
-                
-                else:
-                    print(f"Current project tags {project_name}:{project_tags} are equal to: {correct_project_tag_dict}")
-
-            except Exception as e:
-                print(f"Error tagging project {project_name}: {e}")
-                project_tag_failed += 1
-                
-        # Renew access token after processing a batch
-        access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-        print("Access token renewed.")
+        # Only projects whose tags differ from the desired tags become a write
+        plan = Plan()
+        for cx_project in batch:
+            reconciler.plan_project_tags(plan, cx_project, desired_tags[cx_project.get("id")])
 
-        if i + batch_size < len(cx_projects):  # Avoid sleeping after the last batch
-            print(f"Processed {i + batch_size} projects. Waiting {batch_timeout} seconds before the next batch...")
-            time.sleep(batch_timeout)  # Wait before processing the next batch
+        results = reconciler.apply(plan, dry_run=dry_run)
+        project_tag_fixed += results["applied"]
+        project_tag_failed += results["failed"]
+        project_tag_unchanged += results["unchanged"]
 
     print("Project tag correction is complete.")
     print(f"Total project tag fixed: {project_tag_fixed}")
     print(f"Total project tag failed to fix: {project_tag_failed}")
+    print(f"Total project tag already correct: {project_tag_unchanged}")
+
+    httpRequest.log_connection_stats()
+    api_actions.retry_policy.log_stats()
+
+    if listing_failed:
+        print("The project listing failed part way; only the projects listed before the failure were processed.")
+        sys.exit(1)
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Clean project tags')
     parser.add_argument('-filename', help='filename of the prucore apps',required=True)
+    parser.add_argument('-dry_run', help='print the planned tag changes without applying them', action='store_true')
+    parser.add_argument('-max_workers', help='maximum tag updates sent concurrently', type=int, default=4)
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the main function with the provided exlusions and LBU
-    main(args.filename)
\ No newline at end of file
+    main(args.filename, args.dry_run, args.max_workers, args.rate, args.max_rate)
\ No newline at end of file
@@ -3,6 +3,10 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
+from utility.inventory import Inventory
+from utility.reconciler import Plan, Reconciler
+from utility.journal import Journal
 
 from collections import defaultdict
 from itertools import islice
@@ -22,32 +26,33 @@ def batch_dict(d, batch_size):
             break
         yield batch
 
-def export_failed_repos_to_csv(failed_repos):
+def export_failed_repos_to_csv(failed_repos, missing_default_branch_repos):
 
     if not failed_repos:
         print("No failed repositories to export.")
         return
 
-    fieldnames = ["repository"]
-    data_list = [{"repository": repo} for repo in failed_repos]
+    # Repositories without 'main' or 'master' are exported too, but cannot succeed on a retry
+    fieldnames = ["repository", "status"]
+    data_list = [{"repository": repo, "status": "missing_default_branch" if repo in missing_default_branch_repos else "failed"} for repo in failed_repos]
 
     Csv.extract_to_csv(data_list, fieldnames, directory="./csv_files/protected_branches/error/", filename="failed_repositories")
 
-def generate_protected_branches_list(repo_names, branches, in_scope_values):
-    """Generates a list of dictionaries for protected branches using separate column data."""
+def generate_protected_branches_list(rows):
+    """Generates a list of dictionaries for protected branches from (repo name, branch, in scope) rows."""
     
     branch_list = []
     
-    # Ensure all lists have the same length
-    for i in range(len(repo_names)):
-        repo_name = repo_names[i].strip()
-        branch = branches[i].strip()
-        in_scope = in_scope_values[i].strip() if i < len(in_scope_values) else "NO"  # Default to "NO" if missing
-        
+    for repo_name, branch, in_scope in rows:
+        # A row without a repository or a branch cannot be applied
+        if not repo_name or not branch:
+            print(f"Skipping incomplete row: {repo_name}, {branch}")
+            continue
+
         branch_list.append({
             "repo_name": repo_name,
             "branch": branch,
-            "in_scope": in_scope
+            "in_scope": in_scope or "NO"  # Default to "NO" if missing
         })
     
     return branch_list
@@ -67,9 +72,9 @@ def group_protected_branches(protected_branches):
 
     return dict(grouped_repos)  # Convert defaultdict to normal dict
 
-def main(filename):
+def main(filename, inventory_ttl=6 * 3600, refresh_inventory=False, dry_run=False, max_workers=4, resume=False, retry_from=None, rate=None, max_rate=None):
 
-    httpRequest = HttpRequests()
+    httpRequest = HttpRequests(rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -78,38 +83,69 @@ def main(filename):
     get_access_token_endpoint = routes.get_access_token(tenant_name)
     get_checkmarx_projects_endpoint = routes.get_checkmarx_projects()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-    
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
+
+    # Repository names are resolved against the local inventory instead of one name-regex query per repo
+    inventory = Inventory(ttl=inventory_ttl)
+    inventory.refresh(api_actions, access_token, tenant_url, force=refresh_inventory)
+
     protected_branches_file_path = f"./csv_files/protected_branches/{filename}"
 
-    repo_names = Csv.read_csv(protected_branches_file_path, column_index=0)
-    branches = Csv.read_csv(protected_branches_file_path, column_index=1)
-    in_scope_values = Csv.read_csv(protected_branches_file_path, column_index=2)
+    # Column headers differ between branch exports, so the columns are read by position in a single pass.
+    # Each row keeps its own values together, so a short row cannot shift the columns of the rows after it
+    protected_branch_rows = Csv.iter_csv_rows(protected_branches_file_path, [0, 1, 2])
 
-    protected_branches = generate_protected_branches_list(repo_names, branches, in_scope_values)
+    protected_branches = generate_protected_branches_list(protected_branch_rows)
     grouped_repos = group_protected_branches(protected_branches)
 
+    # Only the repositories that failed in a previous run are processed again, with their branches from the input file.
+    # Those missing 'main' or 'master' are listed in the same error file but cannot succeed on a retry
+    if retry_from:
+        retry_repos = Csv.read_retry_items(retry_from, "./csv_files/protected_branches/error/", "repository", suffix="_failed_repositories.csv",
+                                           where={"status": "failed"})
+        if retry_repos is None:
+            return
+
+        grouped_repos = {repo_name: branch_list for repo_name, branch_list in grouped_repos.items() if repo_name in retry_repos}
+        print(f"Retrying {len(grouped_repos)} of {len(retry_repos)} failed repositories")
+
+    # Completed repositories are journaled so that a failed run can be picked up again with -resume.
+    # A dry run only reads the journal, and a retry adds to the journal of the run it retries
+    journal = None
+    if resume or not dry_run:
+        journal = Journal("checkmarx_update_protected_branch", protected_branches_file_path, resume=resume or bool(retry_from))
+
+    if resume:
+        grouped_repos = {repo_name: branch_list for repo_name, branch_list in grouped_repos.items() if repo_name not in journal}
+        print(f"{len(grouped_repos)} repositories left to process")
+
     # Batch configuration
     batch_size = 100
-    batch_timeout = 60  # seconds
     batches = list(batch_dict(grouped_repos, batch_size))
     total_batches = len(batches)
 
+    reconciler = Reconciler(api_actions, tenant_url, max_workers=max_workers)
+
     # Tracking counters
     repo_updated_count = 0
     repo_failed_update_count = 0
 
     failed_repositories = []
     repos_missing_default_branch = []
+    missing_default_branch_repos = set()
 
     # Process each batch
     for idx, batch in enumerate(batches):
         print(f"Processing batch {idx + 1}/{total_batches} at {datetime.now()}")
 
+        plan = Plan()
+        repo_names_by_project_id = {}
+
         for repo_name, branch_list in batch.items():
             try:
-                cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint, project_name=repo_name)
+                cx_projects = inventory.resolve_projects_by_name(api_actions, access_token, tenant_url, repo_name)
 
                 if not cx_projects:
                     print(f"No Checkmarx project found for {repo_name}")
@@ -149,6 +185,7 @@ def main(filename):
                     print(f"Project '{project_name}' has neither 'main' nor 'master' branch. Skipping...")
 
                     repos_missing_default_branch.append(project_name)
+                    missing_default_branch_repos.add(repo_name)
                     repo_failed_update_count += 1
                     failed_repositories.append(repo_name)
                     continue
@@ -161,27 +198,21 @@ def main(filename):
                     print(f"Adding default branch '{preferred_default_branch}' as a protected branch for repo: {project_name}")
                     new_branches.append(preferred_default_branch)
 
-                # Get currently protected branches from repo_info
-                protected_branch_names = set(branch["name"] for branch in repo_info.get("branches", []))
-
                 if not new_branches:
                     print(f"No new branches specified for repo: {project_name}. Skipping...")
+                    if not dry_run:
+                        journal.mark_done(repo_name)
                     continue
                 
-                # Check if all new_branches are already protected branches
-                if set(new_branches).issubset(protected_branch_names):
+                # Planned only if some of new_branches are not protected yet; the batch's updates are sent together
+                if not reconciler.plan_protected_branches(plan, cx_project, repo_info, new_branches):
                     print(f"All branches in {new_branches} are already protected in repo: {project_name}. Skipping...")
+                    if not dry_run:
+                        journal.mark_done(repo_name)
                     continue
 
-                print(f"Updating protected branches of {project_name}... Adding new branches: {new_branches}")
-
-                api_actions.update_project_repo_protected_branches(access_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, new_branches)
-                
-                print(f"Updated the protected branches of {project_name} with new branches: {new_branches}")
-
-                print("Timeout: 3 seconds...")
-                time.sleep(3)
-                repo_updated_count += 1
+                print(f"Protected branches of {project_name} will be updated... Adding new branches: {new_branches}")
+                repo_names_by_project_id[project_id] = repo_name
                 
             except Exception as e:
 
@@ -191,15 +222,25 @@ def main(filename):
                 failed_repositories.append(repo_name)
                 repo_failed_update_count += 1
 
+        results = reconciler.apply(plan, dry_run=dry_run)
+        repo_updated_count += results["applied"]
+        repo_failed_update_count += results["failed"]
+
+        # Only repositories whose PUT succeeded are journaled; failed ones are exported and redone by a resumed run
+        for mutation in plan.mutations:
+            if mutation.applied and mutation.error is None:
+                journal.mark_done(repo_names_by_project_id[mutation.target])
+            elif mutation.error:
+                failed_repositories.append(repo_names_by_project_id[mutation.target])
+
         try:
-            access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+            access_token = token_manager.get_token()
         except Exception as e:
             print(f"Failed to renew token after batch {idx + 1}: {e}")
             break
 
-        if idx + 1 < total_batches:
-            print(f"Sleeping for {batch_timeout} seconds before next batch...")
-            time.sleep(batch_timeout)
+    if journal:
+        journal.close()
 
     # Final Summary
     print("Batch processing complete.")
@@ -207,21 +248,32 @@ def main(filename):
     print(f"Total repositories failed: {repo_failed_update_count}")
     print(f"Failed Repositories: {failed_repositories}")
 
+    httpRequest.log_connection_stats()
+    api_actions.retry_policy.log_stats()
+
     # Print repos withouth main or master branch
     if repos_missing_default_branch:
         print("Repositories skipped due to missing 'main' or 'master' branches:")
         for repo in repos_missing_default_branch:
             print(f" - {repo}")
 
-    export_failed_repos_to_csv(failed_repositories)
+    export_failed_repos_to_csv(failed_repositories, missing_default_branch_repos)
 
 if __name__ == "__main__":
     # Define command-line arguments
     parser = argparse.ArgumentParser(description='Update protected branches')
     parser.add_argument('-filename', help='filename of the protected branches',required=True)
+    parser.add_argument('-inventory_ttl', help='seconds a local tenant inventory stays valid before it is downloaded again', type=int, default=6 * 3600)
+    parser.add_argument('-refresh_inventory', help='download the tenant inventory even if the local copy is still valid', action='store_true')
+    parser.add_argument('-dry_run', help='print the planned protected branch changes without applying them', action='store_true')
+    parser.add_argument('-max_workers', help='maximum protected branch updates sent concurrently', type=int, default=4)
+    parser.add_argument('-resume', help='skip the repositories a previous run on the same file already completed', action='store_true')
+    parser.add_argument('-retry_from', help='only process the repositories of this error CSV; without a path the latest one in csv_files/protected_branches/error/ is used', nargs='?', const='latest')
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
 
     # Parse the command-line arguments
     args = parser.parse_args()
 
     # Call the main function with the provided exlusions and LBU
-    main(args.filename)
\ No newline at end of file
+    main(args.filename, args.inventory_ttl, args.refresh_inventory, args.dry_run, args.max_workers, args.resume, args.retry_from, args.rate, args.max_rate)
\ No newline at end of file
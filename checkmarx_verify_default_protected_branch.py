@@ -3,6 +3,8 @@ from utility.routes import Routes
 from utility.config_utility import Config
 from utility.csv_utility import Csv
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
+from utility.work_executor import WorkExecutor
 
 import os
 import sys
@@ -10,9 +12,105 @@ import argparse
 import re
 import time
 
-def main():
+def export_failed_repos_to_csv(failed_repos, repos_missing_default_branch):
+
+    if not failed_repos:
+        print("No failed repositories to export.")
+        return
+
+    # Repositories without 'main' or 'master' are exported too, but cannot succeed on a retry
+    missing_default_branch = set(repos_missing_default_branch)
+
+    fieldnames = ["repository", "status"]
+    data_list = [{"repository": repo, "status": "missing_default_branch" if repo in missing_default_branch else "failed"} for repo in failed_repos]
+
+    Csv.extract_to_csv(data_list, fieldnames, directory="./csv_files/protected_branches/verify_error/", filename="failed_repositories")
+
+def process_project(cx_project, result, tenant_url, routes, api_actions, token_manager):
+    project_id = cx_project.get("id")
+    project_name = cx_project.get("name")
+    repo_id = cx_project.get("repoId")
+
+    # Picks up the TokenManager's refreshed token, if it has been renewed
+    access_token = token_manager.get_token()
+
+    if not repo_id:
+        print(f"Project {project_name} has no repository ID.")
+        result.increment("repo_failed_update_count")
+        result.append("failed_repositories", project_name)
+        return
+
+    print(f"Getting data of the project repo: {project_name}")
+    get_project_repo_endpoint = routes.get_project_repo(repo_id)
+    repo_info = api_actions.get_project_repo_info(access_token, tenant_url, get_project_repo_endpoint)
+
+    # get_project_repo_info returns None on any HTTP error; the repo is reported as failed so it can be retried
+    if repo_info is None:
+        print(f"Failed to get the repository data of {project_name}")
+
+        result.append("failed_repositories", project_name)
+        result.increment("repo_failed_update_count")
+        return
+
+    try:
+        # Get the repo branches that are available to be set as protected branches - these are not necessarily protected branches though they could be protected branches already.
+        get_repo_branches_endpoint = routes.get_repo_branches(repo_id)
+        available_repo_branches = api_actions.get_repo_branches(access_token, tenant_url, get_repo_branches_endpoint)
+        extracted_available_branches = set(branch["name"] for branch in available_repo_branches["branchWebDtoList"])
+    except Exception as e:
+        print(f"Error processing {project_name}: {e}")
+        print(f"Failed to get the available branches of {project_name}")
+        
+        result.append("failed_repositories", project_name)
+        result.increment("repo_failed_update_count")
+        return
+    
+    # Check for presence of main or master
+    preferred_default_branch = None
+    if "main" in extracted_available_branches:
+        preferred_default_branch = "main"
+
+    elif "master" in extracted_available_branches:
+        preferred_default_branch = "master"
+
+    else:
+        print(f"Project '{project_name}' has neither 'main' nor 'master' branch. Skipping...")
+
+        result.append("repos_missing_default_branch", project_name)
+        result.increment("repo_failed_update_count")
+        result.append("failed_repositories", project_name)
+        return
+
+    # Get currently protected branches from repo_info
+    protected_branch_names = set(branch["name"] for branch in repo_info.get("branches", []))
+
+    # Check if all preferred_default_branch are already protected branches
+    if preferred_default_branch in protected_branch_names:
+        print(f"The {preferred_default_branch} is already protected in repo: {project_name}. Skipping...")
+        return
+
+    try:
+        print(f"Updating protected branches of {project_name}... Adding the default branch: {preferred_default_branch}")
+
+        # A failed PUT is swallowed and returns None unless the call is asked to raise
+        api_actions.update_project_repo_protected_branches(access_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, [preferred_default_branch],
+                                                           raise_errors=True)
+        
+        print(f"Updated the protected branches of {project_name} with the default branch: {preferred_default_branch}")
+
+        result.increment("repo_updated_count")
+
+    except Exception as e:
 
-    httpRequest = HttpRequests()
+        print(f"Error processing {project_name}: {e}")
+        print(f"Failed to add {preferred_default_branch} to {project_name}")
+        
+        result.append("failed_repositories", project_name)
+        result.increment("repo_failed_update_count")
+
+def main(backend="serial", max_workers=3, retry_from=None, rate=None, max_rate=None):
+
+    httpRequest = HttpRequests(pool_maxsize=max(max_workers, 10), rate=rate, max_rate=max_rate)
 
     config = Config()
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -21,106 +119,28 @@ def main():
     get_access_token_endpoint = routes.get_access_token(tenant_name)
     get_checkmarx_projects_endpoint = routes.get_checkmarx_projects()
 
-    api_actions = ApiActions(httpRequest)
-    access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint)
+    api_actions = ApiActions(httpRequest, token_manager=token_manager)
+    access_token = token_manager.get_token()
     cx_projects = api_actions.get_checkmarx_projects(access_token, tenant_url, get_checkmarx_projects_endpoint)
-    
-    # Batch configuration
-    batch_size = 100
-    batch_timeout = 3  # seconds
-    sleep_time = 0 # seconds
-
-    # Tracking counters
-    repo_updated_count = 0
-    repo_failed_update_count = 0
-
-    failed_repositories = []
-    repos_missing_default_branch = []
-
-    for i in range(0, len(cx_projects), batch_size):
-        batch = cx_projects[i:i + batch_size]
-
-        for cx_project in batch:
-            project_id = cx_project.get("id")
-            project_name = cx_project.get("name")
-            repo_id = cx_project.get("repoId")
-
-            if not repo_id:
-                print(f"Project {project_name} has no repository ID.")
-                repo_failed_update_count += 1
-                failed_repositories.append(project_name)
-                continue
-
-            print(f"Getting data of the project repo: {project_name}")
-            get_project_repo_endpoint = routes.get_project_repo(repo_id)
-            repo_info = api_actions.get_project_repo_info(access_token, tenant_url, get_project_repo_endpoint)
-
-            try:
-                # Get the repo branches that are available to be set as protected branches - these are not necessarily protected branches though they could be protected branches already.
-                get_repo_branches_endpoint = routes.get_repo_branches(repo_id)
-                available_repo_branches = api_actions.get_repo_branches(access_token, tenant_url, get_repo_branches_endpoint)
-                extracted_available_branches = set(branch["name"] for branch in available_repo_branches["branchWebDtoList"])
-            except Exception as e:
-                print(f"Error processing {project_name}: {e}")
-                print(f"Failed to get the available branches of {project_name}")
-                
-                failed_repositories.append(project_name)
-                repo_failed_update_count += 1
-            
-            # Check for presence of main or master
-            preferred_default_branch = None
-            if "main" in extracted_available_branches:
-                preferred_default_branch = "main"
-
-            elif "master" in extracted_available_branches:
-                preferred_default_branch = "master"
-
-            else:
-                print(f"Project '{project_name}' has neither 'main' nor 'master' branch. Skipping...")
-
-                repos_missing_default_branch.append(project_name)
-                repo_failed_update_count += 1
-                failed_repositories.append(project_name)
-                continue
-
-            # Get currently protected branches from repo_info
-            protected_branch_names = set(branch["name"] for branch in repo_info.get("branches", []))
-
-            # Check if all preferred_default_branch are already protected branches
-            if preferred_default_branch in protected_branch_names:
-                print(f"The {preferred_default_branch} is already protected in repo: {project_name}. Skipping...")
-                continue
-
-            try:
-                print(f"Updating protected branches of {project_name}... Adding the default branch: {preferred_default_branch}")
-
-                api_actions.update_project_repo_protected_branches(access_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, [preferred_default_branch])
-                
-                print(f"Updated the protected branches of {project_name} with the default branch: {preferred_default_branch}")
-                print(f"Timeout: {sleep_time} seconds...")
-
-                time.sleep(sleep_time)
-                repo_updated_count += 1
-
-            except Exception as e:
-
-                print(f"Error processing {project_name}: {e}")
-                print(f"Failed to add {preferred_default_branch} to {project_name}")
-                
-                failed_repositories.append(project_name)
-                repo_failed_update_count += 1
-            
-        try:
-            # Renew access token after processing a batch
-            access_token = api_actions.get_access_token(token, tenant_iam_url, get_access_token_endpoint)
-            print("Access token renewed.")
-        except Exception as e:
-            print(f"Failed to renew token after batch {i + 1}: {e}")
-            break
-
-        if i + batch_size < len(cx_projects):  # Avoid sleeping after the last batch
-            print(f"Processed {i + batch_size} projects. Waiting {batch_timeout} seconds before the next batch...")
-            time.sleep(batch_timeout)  # Wait before processing the next batch
+
+    # Only the repositories that failed in a previous run are processed again
+    if retry_from:
+        retry_repos = Csv.read_retry_items(retry_from, "./csv_files/protected_branches/verify_error/", "repository", suffix="_failed_repositories.csv", where={"status": "failed"})
+        if retry_repos is None:
+            return
+
+        cx_projects = [cx_project for cx_project in cx_projects if cx_project.get("name") in retry_repos]
+        print(f"Retrying {len(cx_projects)} of {len(retry_repos)} failed repositories")
+
+    # Each worker counts into its own result; the results are merged once every project is done
+    executor = WorkExecutor(backend, max_workers=max_workers)
+    summary = executor.run(cx_projects, process_project, tenant_url, routes, api_actions, token_manager)
+
+    repo_updated_count = summary.get_count("repo_updated_count")
+    repo_failed_update_count = summary.get_count("repo_failed_update_count")
+    failed_repositories = summary.get_list("failed_repositories")
+    repos_missing_default_branch = summary.get_list("repos_missing_default_branch")
 
     # Final Summary
     print("Batch processing complete.")
@@ -128,11 +148,28 @@ def main():
     print(f"Total repositories failed: {repo_failed_update_count}")
     print(f"Failed Repositories: {failed_repositories}")
 
+    executor.log_throughput(summary)
+    httpRequest.log_connection_stats()
+    api_actions.retry_policy.log_stats()
+
     # Print repos withouth main or master branch
     if repos_missing_default_branch:
         print("Repositories skipped due to missing 'main' or 'master' branches:")
         for repo in repos_missing_default_branch:
             print(f" - {repo}")
 
+    export_failed_repos_to_csv(failed_repositories, repos_missing_default_branch)
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Define command-line arguments
+    parser = argparse.ArgumentParser(description='Verify default protected branch')
+    parser.add_argument('-backend', help='how projects are processed: serial or thread', choices=["serial", "thread"], default="serial")
+    parser.add_argument('-max_workers', help='worker threads for the thread backend', type=int, default=3)
+    parser.add_argument('-retry_from', help='only process the repositories of this error CSV; without a path the latest one in csv_files/protected_branches/verify_error/ is used', nargs='?', const='latest')
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
+
+    # Parse the command-line arguments
+    args = parser.parse_args()
+
+    main(args.backend, args.max_workers, args.retry_from, args.rate, args.max_rate)
@@ -1,32 +1,77 @@
 from utility.http_utility import HttpRequests
+from utility.async_http_utility import AsyncHttpRequests
+from utility.async_api_actions import AsyncApiActions
 from utility.routes import Routes
 from utility.config_utility import Config
 from utility.api_actions import ApiActions
+from utility.token_manager import TokenManager
 from utility.logger import Logger
 from utility.csv_utility import Csv
-
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from utility.work_executor import WorkExecutor
 
 
+import argparse
 import time
 import datetime
 import os
 
-def process_project(cx_project, token, tenant_name, tenant_iam_url, tenant_url, routes, api_actions, log, counters, project_timeout):
+def check_repo_id(cx_project, result, log):
+    # Returns the project's repository ID, or None after recording the project as failed
+    repo_id = cx_project.get("repoId")
+
+    if not repo_id:
+        log.warning(f"Project {cx_project.get('name')} has no repository ID.")
+        result.increment('repo_failed_update_count')
+        result.append('failed_repositories', cx_project.get("name"))
+        return None
+
+    log.info(f"Processing project: {cx_project.get('name')}")
+    return repo_id
+
+def choose_branch_to_protect(project_name, repo_info, available_repo_branches, result, log):
+    """
+    The branch decision shared by the thread and asyncio paths: main, else master, unless it is already protected.
+    Returns the branch to add to the protected branches, or None when there is nothing to update.
+    """
+
+    extracted_available_branches = {branch["name"] for branch in available_repo_branches.get("branchWebDtoList", [])}
+
+    preferred_default_branch = None
+    if "main" in extracted_available_branches:
+        preferred_default_branch = "main"
+    elif "master" in extracted_available_branches:
+        preferred_default_branch = "master"
+
+    if not preferred_default_branch:
+        log.skipped(f"Project '{project_name}' has neither 'main' nor 'master' branch.")
+        result.append('repos_missing_default_branch', project_name)
+        result.increment('repo_failed_update_count')
+        return None
+
+    protected_branch_names = {branch["name"] for branch in repo_info.get("branches", [])}
+    if preferred_default_branch in protected_branch_names:
+        log.skipped(f"{preferred_default_branch} is already protected in repo: {project_name}.")
+        return None
+
+    log.info(f"Updating protected branches of {project_name}... Adding: {preferred_default_branch}")
+    return preferred_default_branch
+
+def record_failure(project_name, result, log, message):
+    log.error(message)
+    result.append('failed_repositories', project_name)
+    result.increment('repo_failed_update_count')
+
+def process_project(cx_project, result, token, tenant_name, tenant_iam_url, tenant_url, routes, api_actions, log):
     project_id = cx_project.get("id")
     project_name = cx_project.get("name")
-    repo_id = cx_project.get("repoId")
 
+    repo_id = check_repo_id(cx_project, result, log)
     if not repo_id:
-        log.warning(f"Project {project_name} has no repository ID.")
-        counters['repo_failed_update_count'] += 1
-        counters['failed_repositories'].append(project_name)
         return
 
-    log.info(f"Processing project: {project_name}")
+    get_project_repo_endpoint = routes.get_project_repo(repo_id)
 
     try:
-        get_project_repo_endpoint = routes.get_project_repo(repo_id)
         valid_token = api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
         repo_info = api_actions.get_project_repo_info(valid_token, tenant_url, get_project_repo_endpoint)
 
@@ -34,50 +79,89 @@ def process_project(cx_project, token, tenant_name, tenant_iam_url, tenant_url,
         valid_token = api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
         available_repo_branches = api_actions.get_repo_branches(valid_token, tenant_url, get_repo_branches_endpoint)
 
-        extracted_available_branches = {branch["name"] for branch in available_repo_branches.get("branchWebDtoList", [])}
-        time.sleep(project_timeout)
+        # The ApiActions reads return None on HTTP errors
+        if repo_info is None:
+            raise RuntimeError("the repository data could not be retrieved")
+
+        if available_repo_branches is None:
+            raise RuntimeError("the repository branches could not be retrieved")
 
     except Exception as e:
-        log.error(f"Error fetching repo data for {project_name}: {e}")
-        counters['failed_repositories'].append(project_name)
-        counters['repo_failed_update_count'] += 1
+        record_failure(project_name, result, log, f"Error fetching repo data for {project_name}: {e}")
         return
 
-    preferred_default_branch = None
-    if "main" in extracted_available_branches:
-        preferred_default_branch = "main"
-    elif "master" in extracted_available_branches:
-        preferred_default_branch = "master"
+    branch = choose_branch_to_protect(project_name, repo_info, available_repo_branches, result, log)
+    if not branch:
+        return
 
-    if not preferred_default_branch:
-        log.skipped(f"Project '{project_name}' has neither 'main' nor 'master' branch.")
-        counters['repos_missing_default_branch'].append(project_name)
-        counters['repo_failed_update_count'] += 1
+    try:
+        valid_token = api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
+        # A failed PUT is swallowed and returns None unless the call is asked to raise
+        api_actions.update_project_repo_protected_branches(valid_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, [branch], raise_errors=True)
+
+        log.info(f"Updated {project_name} with {branch}")
+        result.increment('repo_updated_count')
+
+    except Exception as e:
+        record_failure(project_name, result, log, f"Error updating {project_name}: {e}")
+
+async def process_project_async(cx_project, result, token, tenant_name, tenant_iam_url, tenant_url, routes, async_api_actions, log):
+    # Same flow as process_project; only the requests differ, the two reads being awaited together
+    project_id = cx_project.get("id")
+    project_name = cx_project.get("name")
+
+    repo_id = check_repo_id(cx_project, result, log)
+    if not repo_id:
         return
 
-    protected_branch_names = {branch["name"] for branch in (repo_info or {}).get("branches", [])}
-    if preferred_default_branch in protected_branch_names:
-        log.skipped(f"{preferred_default_branch} is already protected in repo: {project_name}.")
-        time.sleep(project_timeout)
+    get_project_repo_endpoint = routes.get_project_repo(repo_id)
+
+    try:
+        get_repo_branches_endpoint = routes.get_repo_branches(repo_id)
+        valid_token = await async_api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
+
+        repo_info, available_repo_branches = await async_api_actions.gather(
+            async_api_actions.get_project_repo_info(valid_token, tenant_url, get_project_repo_endpoint),
+            async_api_actions.get_repo_branches(valid_token, tenant_url, get_repo_branches_endpoint)
+        )
+
+        # The ApiActions reads return None on HTTP errors
+        if repo_info is None:
+            raise RuntimeError("the repository data could not be retrieved")
+
+        if available_repo_branches is None:
+            raise RuntimeError("the repository branches could not be retrieved")
+
+    except Exception as e:
+        record_failure(project_name, result, log, f"Error fetching repo data for {project_name}: {e}")
+        return
+
+    branch = choose_branch_to_protect(project_name, repo_info, available_repo_branches, result, log)
+    if not branch:
         return
 
     try:
-        get_project_repo_endpoint = routes.get_project_repo(repo_id)
-        log.info(f"Updating protected branches of {project_name}... Adding: {preferred_default_branch}")
-        valid_token = api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
-        api_actions.update_project_repo_protected_branches(valid_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, [preferred_default_branch])
+        valid_token = await async_api_actions.get_valid_token(token, tenant_iam_url, routes.get_access_token(tenant_name))
+        # A failed PUT is swallowed and returns None unless the call is asked to raise
+        await async_api_actions.update_project_repo_protected_branches(valid_token, tenant_url, get_project_repo_endpoint, repo_info, project_id, [branch],
+                                                                       raise_errors=True)
 
-        log.info(f"Updated {project_name} with {preferred_default_branch}")
-        counters['repo_updated_count'] += 1
-        time.sleep(project_timeout)
+        log.info(f"Updated {project_name} with {branch}")
+        result.increment('repo_updated_count')
 
     except Exception as e:
-        log.error(f"Error updating {project_name}: {e}")
-        counters['failed_repositories'].append(project_name)
-        counters['repo_failed_update_count'] += 1
+        record_failure(project_name, result, log, f"Error updating {project_name}: {e}")
+
+def main(backend="thread", max_workers=3, max_in_flight=10, retry_from=None, rate=None, max_rate=None):
+    use_async = backend == "asyncio"
+
+    # Size the connection pool to the worker count so every thread keeps its own keep-alive connection
+    if use_async:
+        asyncHttpRequest = AsyncHttpRequests(max_in_flight=max_in_flight, rate=rate, max_rate=max_rate)
+        httpRequest = asyncHttpRequest.httpRequest
+    else:
+        httpRequest = HttpRequests(pool_connections=2, pool_maxsize=max_workers, rate=rate, max_rate=max_rate)
 
-def main():
-    httpRequest = HttpRequests()
     config = Config()
     log = Logger("verify_default_protected_branch")
     token, tenant_name, tenant_iam_url, tenant_url = config.get_config()
@@ -86,58 +170,50 @@ def main():
     get_access_token_endpoint = routes.get_access_token(tenant_name)
     get_checkmarx_projects_endpoint = routes.get_checkmarx_projects()
 
-    api_actions = ApiActions(httpRequest, logger=log)
-    valid_token = api_actions.get_valid_token(token, tenant_iam_url, get_access_token_endpoint)
+    token_manager = TokenManager(httpRequest, token, tenant_iam_url, get_access_token_endpoint, logger=log)
+    api_actions = ApiActions(httpRequest, logger=log, token_manager=token_manager)
+    valid_token = token_manager.get_token()
     cx_projects = api_actions.get_checkmarx_projects(valid_token, tenant_url, get_checkmarx_projects_endpoint)
 
-    # Batch configuration
-    batch_size = 100
-    batch_timeout = 3  # seconds
-    project_timeout = 1.5
-
-    # Thread max workers
-    thread_workers = 3
-
-    # Tracking counters
-    counters = {
-        "repo_updated_count": 0,
-        "repo_failed_update_count": 0,
-        "failed_repositories": [],
-        "repos_missing_default_branch": []
-    }
-    
-    for batch_num, i in enumerate(range(0, len(cx_projects), batch_size), start=1):
-        batch = cx_projects[i:i + batch_size]
-        log.info(f"Processing Batch {batch_num} with {len(batch)} projects...")
-
-        with ThreadPoolExecutor(max_workers=thread_workers) as executor:
-            futures = [
-                executor.submit(
-                    process_project,
-                    cx_project, token, tenant_name, tenant_iam_url, tenant_url, routes, api_actions, log, counters, project_timeout
-                )
-                for cx_project in batch
-            ]
-            for future in as_completed(futures):
-                pass  # All logging and error handling is inside `process_project`
-
-        if i + batch_size < len(cx_projects):
-            log.info(f"Processed {i + batch_size} projects. Waiting {batch_timeout} seconds...")
-            time.sleep(batch_timeout)
+    # Only the repositories that failed in a previous run are processed again; those missing 'main' or 'master'
+    # are listed in the same summary CSV but cannot succeed on a retry
+    if retry_from:
+        retry_repos = Csv.read_retry_items(retry_from, "./csv_files/", "repo_name", suffix="_repos_summary.csv", where={"status": "failed"})
+        if retry_repos is None:
+            return
+
+        cx_projects = [cx_project for cx_project in cx_projects if cx_project.get("name") in retry_repos]
+        log.info(f"Retrying {len(cx_projects)} of {len(retry_repos)} repositories from the summary CSV")
+
+    # Each worker counts into its own result; the results are merged once every project is done
+    if use_async:
+        log.info(f"Processing {len(cx_projects)} projects with up to {max_in_flight} requests in flight...")
+        async_api_actions = AsyncApiActions(asyncHttpRequest, logger=log, api_actions=api_actions)
+        executor = WorkExecutor("asyncio", max_workers=max_in_flight, logger=log)
+        counters = executor.run(cx_projects, process_project_async, token, tenant_name, tenant_iam_url, tenant_url, routes, async_api_actions, log)
+
+    else:
+        log.info(f"Processing {len(cx_projects)} projects with the {backend} backend and {max_workers} workers...")
+        executor = WorkExecutor(backend, max_workers=max_workers, logger=log)
+        counters = executor.run(cx_projects, process_project, token, tenant_name, tenant_iam_url, tenant_url, routes, api_actions, log)
+
+    executor.log_throughput(counters)
+    httpRequest.log_connection_stats(log)
+    api_actions.retry_policy.log_stats(log)
 
     # --- Final Summary ---
     print("\n=== Summary ===")
-    print(f"Total repositories updated: {counters['repo_updated_count']}")
-    print(f"Total repositories failed: {counters['repo_failed_update_count']}")
+    print(f"Total repositories updated: {counters.get_count('repo_updated_count')}")
+    print(f"Total repositories failed: {counters.get_count('repo_failed_update_count')}")
     
-    if counters['repos_missing_default_branch']:
+    if counters.get_list('repos_missing_default_branch'):
         print("Failed Repositories:")
-        for repo in counters['failed_repositories']:
+        for repo in counters.get_list('failed_repositories'):
             print(f" - {repo}")
 
-    if counters['repos_missing_default_branch']:
+    if counters.get_list('repos_missing_default_branch'):
         print("Repositories missing 'main' or 'master':")
-        for repo in counters['repos_missing_default_branch']:
+        for repo in counters.get_list('repos_missing_default_branch'):
             print(f" - {repo}")
     
     # Write summary + CSV
@@ -148,18 +224,18 @@ def main():
 
     with open(summary_file, "a") as f:
         f.write("### Checkmarx Protected Branch Verification Summary\n\n")
-        f.write(f"Total repositories updated: {counters['repo_updated_count']}\n")
-        f.write(f"Total repositories failed: {counters['repo_failed_update_count']}\n\n")
+        f.write(f"Total repositories updated: {counters.get_count('repo_updated_count')}\n")
+        f.write(f"Total repositories failed: {counters.get_count('repo_failed_update_count')}\n\n")
 
-        if counters['failed_repositories']:
+        if counters.get_list('failed_repositories'):
             f.write("**Failed Repositories:**\n")
-            for repo in counters['failed_repositories']:
+            for repo in counters.get_list('failed_repositories'):
                 f.write(f"{repo}\n")
                 csv_data.append({"repo_name": repo, "status": "failed"})
 
-        if counters['repos_missing_default_branch']:
+        if counters.get_list('repos_missing_default_branch'):
             f.write("\n**Repositories missing 'main' or 'master':**\n")
-            for repo in counters['repos_missing_default_branch']:
+            for repo in counters.get_list('repos_missing_default_branch'):
                 f.write(f"{repo}\n")
                 csv_data.append({"repo_name": repo, "status": "missing_default_branch"})
 
@@ -168,4 +244,17 @@ def main():
         Csv.extract_to_csv(csv_data, fieldnames, directory="./csv_files/", filename=f"{timestamp}_repos_summary")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    # Define command-line arguments
+    parser = argparse.ArgumentParser(description='Verify default protected branch')
+    parser.add_argument('-backend', help='how projects are processed: serial, thread or asyncio', choices=WorkExecutor.BACKENDS, default="thread")
+    parser.add_argument('-max_workers', help='worker threads for the thread backend', type=int, default=3)
+    parser.add_argument('-use_async', help='same as -backend asyncio', action='store_true')
+    parser.add_argument('-max_in_flight', help='maximum concurrent requests for the asyncio backend; each one runs on its own worker thread and all of them share the rate limit', type=int, default=10)
+    parser.add_argument('-retry_from', help='only process the repositories of this summary CSV; without a path the latest one in csv_files/ is used', nargs='?', const='latest')
+    parser.add_argument('-rate', help='requests per second to start pacing at; by default requests are only paced once the tenant throttles', type=float)
+    parser.add_argument('-max_rate', help='upper bound on requests per second; no bound by default', type=float)
+
+    # Parse the command-line arguments
+    args = parser.parse_args()
+
+    main("asyncio" if args.use_async else args.backend, args.max_workers, args.max_in_flight, args.retry_from, args.rate, args.max_rate)
\ No newline at end of file
@@ -4,13 +4,22 @@ import base64
 import sys
 import json
 from utility.exception_handler import ExceptionHandler
+from utility.helper_functions import HelperFunctions
+from utility.retry_policy import RetryPolicy
+from concurrent.futures import ThreadPoolExecutor
 import time
 
 class ApiActions:
 
-    def __init__(self, httpRequest, logger=None):
+    def __init__(self, httpRequest, logger=None, retry_policy=None, token_manager=None):
         self.httpRequest = httpRequest
         self.logger = logger
+
+        # When set, get_valid_token delegates to it and calls rejected with 401 are re-authenticated and replayed
+        self.token_manager = token_manager
+
+        # Applied by httpRequest to every request made below; one budget for the whole run
+        self.retry_policy = RetryPolicy.attach(httpRequest, retry_policy, logger=logger)
         self._expiry = 0
         self._cached_token = None
 
@@ -51,6 +60,9 @@ class ApiActions:
         Wrapper that checks expiry and renews if needed.
         Params remain the same as get_access_token for compatibility.
         """
+        if self.token_manager:
+            return self.token_manager.get_token()
+
         if not self._cached_token or time.time() >= self._expiry:
             if self.logger:
                 self.logger.info("Token expired or missing. Renewing...")
@@ -59,10 +71,12 @@ class ApiActions:
             return self.get_access_token(token, base_url, endpoint)
         return self._cached_token
 
-    @ExceptionHandler.handle_exception
-    def get_checkmarx_projects(self, token, base_url, endpoint, empty_tag="false", project_name=None):
+    def _get_projects_page(self, token, url, offset, limit, empty_tag="false", project_name=None, sort=None):
+        # Returns (projects, total count) for one page, or (None, None) if the response is not usable
 
-        url = f"https://{base_url}{endpoint}"
+        # Long-running iterations pick up the token the TokenManager renewed in the meantime
+        if self.token_manager and self.token_manager.owns(token):
+            token = self.token_manager.get_token()
 
         headers = {
             "accept": "application/json; version=1.0",
@@ -70,35 +84,187 @@ class ApiActions:
             "Content-Type": "application/json; version=1.0"
         }
 
-        limit = 100  
-        offset = 0   
-        all_projects = []
+        params = {
+            "limit": limit,
+            "offset": offset,
+            "empty-tags": empty_tag
+        }
 
-        while True:
-            params = {
-                "limit": limit,
-                "offset": offset,
-                "empty-tags": empty_tag
-            }
+        if project_name is not None:
+            params["name-regex"] = f"(?i)^{project_name}$"
 
-            if project_name is not None:
-                params["name-regex"] = f"(?i)^{project_name}$"
+        if sort is not None:
+            params["sort"] = sort
 
-            response = self.httpRequest.get_api_request(url, headers=headers, params=params)
+        response = self.httpRequest.get_api_request(url, headers=headers, params=params)
+
+        if not response or "projects" not in response or not isinstance(response["projects"], list):
+            return None, None
+
+        return response["projects"], response.get("filteredTotalCount", response.get("totalCount"))
+
+    @ExceptionHandler.handle_exception
+    def get_checkmarx_projects(self, token, base_url, endpoint, empty_tag="false", project_name=None, page_size=100, max_workers=4):
+        """
+        Retrieve all projects. The first page's total count is used to fetch the remaining pages
+        concurrently (at most max_workers at a time); the result keeps the API order without duplicates.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        def get_page(offset):
+            return self._get_projects_page(token, url, offset, page_size, empty_tag, project_name)
+
+        first_page, total_count = get_page(0)
+
+        if first_page is None:
+            print("Error: 'projects' key missing or not a list in API response")
+            return None
 
-            if not response or "projects" not in response or not isinstance(response["projects"], list):
+        pages = [first_page]
+
+        if len(first_page) == page_size and total_count:
+            offsets = list(range(page_size, total_count, page_size))
+
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                # map keeps the pages in offset order
+                for page, _ in executor.map(get_page, offsets):
+                    if page is None:
+                        print("Error: 'projects' key missing or not a list in API response")
+                        return None
+                    pages.append(page)
+
+        # Without a total count, or if projects were added while paging, continue one page at a time
+        offset = page_size * len(pages)
+        while len(pages[-1]) == page_size:
+            page, _ = get_page(offset)
+
+            if page is None:
                 print("Error: 'projects' key missing or not a list in API response")
                 return None
 
-            all_projects.extend(response["projects"])
+            pages.append(page)
+            offset += page_size
+
+        all_projects = []
+        seen_project_ids = set()
+
+        for page in pages:
+            for project in page:
+                project_id = project.get("id")
 
-            if len(response["projects"]) < limit:
-                break  
+                if project_id in seen_project_ids:
+                    continue
 
-            offset += limit
+                seen_project_ids.add(project_id)
+                all_projects.append(project)
 
         return all_projects
     
+    def iter_checkmarx_projects(self, token, base_url, endpoint, empty_tag="false", project_name=None, page_size=100):
+        """
+        Yield projects one page at a time instead of building the full list.
+        The next page is requested in the background while the caller works on the current one.
+
+        A page that cannot be retrieved raises, so the caller can tell a failed listing from the end of the tenant.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        seen_project_ids = set()
+        offset = 0
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            next_page = executor.submit(self._get_projects_page, token, url, offset, page_size, empty_tag, project_name)
+
+            while next_page is not None:
+                try:
+                    page, _ = next_page.result()
+                except Exception as e:
+                    print(f"Error retrieving projects at offset {offset}: {e}")
+                    raise
+
+                if page is None:
+                    raise RuntimeError(f"'projects' key missing or not a list in API response at offset {offset}")
+
+                offset += page_size
+                next_page = None
+
+                if len(page) == page_size:
+                    next_page = executor.submit(self._get_projects_page, token, url, offset, page_size, empty_tag, project_name)
+
+                for project in page:
+                    project_id = project.get("id")
+
+                    if project_id in seen_project_ids:
+                        continue
+
+                    seen_project_ids.add(project_id)
+                    yield project
+
+    @ExceptionHandler.handle_exception
+    def get_checkmarx_projects_updated_since(self, token, base_url, endpoint, since, page_size=100):
+        """
+        Retrieve the projects created or updated after `since` (an aware datetime).
+        Pages are requested newest-first and reading stops at the first project that is not newer.
+        Returns {"projects": [...], "totalCount": n}, or None if the API did not honour the ordering,
+        in which case the caller has to do a full listing.
+
+        Every page read is checked to be in update order as a whole before any of it is used, so a
+        listing that ignores the sort is detected even when its first project is already older than `since`.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        changed_projects = []
+        total_count = None
+        previous_timestamp = None
+        offset = 0
+
+        while True:
+            page, page_total_count = self._get_projects_page(token, url, offset, page_size, sort="-updated-at")
+
+            if page is None:
+                print("Error: 'projects' key missing or not a list in API response")
+                return None
+
+            if total_count is None:
+                total_count = page_total_count
+
+            timestamps = [HelperFunctions.parse_timestamp(project.get("updatedAt") or project.get("createdAt")) for project in page]
+
+            for timestamp in timestamps:
+                if timestamp is None or (previous_timestamp is not None and timestamp > previous_timestamp):
+                    print("Projects were not returned in update order; a full listing is needed")
+                    return None
+
+                previous_timestamp = timestamp
+
+            for project, timestamp in zip(page, timestamps):
+                if timestamp <= since:
+                    return {"projects": changed_projects, "totalCount": total_count}
+
+                changed_projects.append(project)
+
+            if len(page) < page_size:
+                return {"projects": changed_projects, "totalCount": total_count}
+
+            offset += page_size
+
+    @ExceptionHandler.handle_exception
+    def get_project_by_id(self, token, base_url, endpoint):
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            "accept": "application/json; version=1.0",
+            "authorization": f"Bearer {token}",
+            "Content-Type": "application/json; version=1.0"
+        }
+
+        response = self.httpRequest.get_api_request(url, headers=headers)
+        return response
+
     @ExceptionHandler.handle_exception
     def delete_checkmarx_project(self, token, base_url, endpoint):
 
@@ -265,6 +431,33 @@ class ApiActions:
         response = self.httpRequest.get_api_request(url, headers=headers, params=params)
         return response
 
+    @ExceptionHandler.handle_exception
+    def update_project(self, token, base_url, endpoint, project, fields):
+        """
+        PUT the project body with the given fields (e.g. tags, criticality, mainBranch) replaced, in one request.
+        """
+        
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            "accept": "application/json; version=1.0",
+            "authorization": f"Bearer {token}",
+            "Content-Type": "application/json; version=1.0"
+        }
+
+        payload = {
+            "name": project.get("name"),
+            "tags": project.get("tags"),
+            "groups": project.get("groups"),
+            "criticality": project.get("criticality"),
+            "repoUrl": project.get("repoUrl"),
+            "mainBranch": project.get("mainBranch")
+        }
+        payload.update(fields)
+
+        response = self.httpRequest.put_api_request(url, headers=headers, json=payload)
+        return response
+
     @ExceptionHandler.handle_exception
     def replace_project_tags(self, token, base_url, endpoint, project, tags_dict):
         
@@ -409,6 +602,44 @@ class ApiActions:
         response = self.httpRequest.get_api_request(url, headers=headers, params=params)
         return response
 
+    @ExceptionHandler.handle_exception
+    def get_checkmarx_applications(self, token, base_url, endpoint, page_size=100):
+        """
+        Retrieve all applications, one page after another.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            "accept": "application/json; version=1.0",
+            "authorization": f"Bearer {token}",
+            "Content-Type": "application/json; version=1.0"
+        }
+
+        offset = 0
+        all_applications = []
+
+        while True:
+            params = {
+                "limit": page_size,
+                "offset": offset
+            }
+
+            response = self.httpRequest.get_api_request(url, headers=headers, params=params)
+
+            if not response or not isinstance(response.get("applications"), list):
+                print("Error: 'applications' key missing or not a list in API response")
+                return None
+
+            all_applications.extend(response["applications"])
+
+            if len(response["applications"]) < page_size:
+                break
+
+            offset += page_size
+
+        return all_applications
+
     @ExceptionHandler.handle_exception
     def get_application_by_id(self, token, base_url, endpoint):
         
@@ -500,6 +731,46 @@ class ApiActions:
         response =  self.httpRequest.get_api_request(url, headers=headers, params=params)
         return response
     
+    @ExceptionHandler.handle_exception
+    def get_all_groups(self, token, base_url, endpoint, page_size=100):
+        """
+        Retrieve all groups with their client role mappings, one page after another.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            'Authorization': f"Bearer {token}",
+            'Accept': "application/json; version=1.0",
+            'Content-Type': "application/json; version=1.0",
+            'User-Agent': "python-requests/2.32.3"
+        }
+
+        first = 0
+        all_groups = []
+
+        while True:
+            params = {
+                'first': first,
+                'max': page_size,
+                'briefRepresentation': 'false'
+            }
+
+            response = self.httpRequest.get_api_request(url, headers=headers, params=params)
+
+            if not isinstance(response, list):
+                print("Error: groups response is not a list")
+                return None
+
+            all_groups.extend(response)
+
+            if len(response) < page_size:
+                break
+
+            first += page_size
+
+        return all_groups
+
     @ExceptionHandler.handle_exception
     def create_group(self, token, base_url, endpoint, group):
 
@@ -516,7 +787,31 @@ class ApiActions:
             'name': group
         }
 
-        response = requests.post(url, headers=headers, json=payload)
+        response = self.httpRequest.post_api_request_raw(url, headers=headers, json=payload)
+        return response
+
+    @ExceptionHandler.handle_exception
+    def partial_import(self, token, base_url, endpoint, groups, if_resource_exists="SKIP"):
+        """
+        Create many groups, with their client role mappings, in a single realm partial import.
+        Returns the import summary, whose 'results' list has one entry (action, resourceName, id) per resource.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            'Authorization': f"Bearer {token}",
+            'Accept': "application/json; version=1.0",
+            'Content-Type': "application/json; version=1.0",
+            'User-Agent': "python-requests/2.32.3"
+        }
+
+        payload = {
+            'ifResourceExists': if_resource_exists,
+            'groups': groups
+        }
+
+        response = self.httpRequest.post_api_request(url, headers=headers, json=payload)
         return response
 
     @ExceptionHandler.handle_exception
@@ -561,6 +856,30 @@ class ApiActions:
         response = self.httpRequest.post_api_request(url, headers=headers, json=payload)
         return response
 
+    @ExceptionHandler.handle_exception
+    def get_entity_assignments(self, token, base_url, endpoint, entity_id, entity_type="group"):
+        """
+        Retrieve the resources (applications, projects, tenant) an entity is assigned to.
+        Returns a list with one entry (resourceID, resourceType, ...) per assignment.
+        """
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            'Authorization': f"Bearer {token}",
+            'Accept': "application/json; version=1.0",
+            'Content-Type': "application/json; version=1.0",
+            'User-Agent': "python-requests/2.32.3"
+        }
+
+        params = {
+            'entity-id': entity_id,
+            'entity-type': entity_type
+        }
+
+        response = self.httpRequest.get_api_request(url, headers=headers, params=params)
+        return response
+
     @ExceptionHandler.handle_exception
     def get_identity_providers(self, token, base_url, endpoint):
 
@@ -576,6 +895,21 @@ class ApiActions:
         response =  self.httpRequest.get_api_request(url, headers=headers)
         return response
 
+    @ExceptionHandler.handle_exception
+    def get_mappers(self, token, base_url, endpoint):
+
+        url = f"https://{base_url}{endpoint}"
+
+        headers = {
+            'Authorization': f"Bearer {token}",
+            'Accept': "application/json; version=1.0",
+            'Content-Type': "application/json; version=1.0",
+            'User-Agent': "python-requests/2.32.3"
+        }
+
+        response = self.httpRequest.get_api_request(url, headers=headers)
+        return response
+
     @ExceptionHandler.handle_exception
     def create_mapper(self, token, base_url, endpoint, group_name, idp_alias):
 
@@ -602,5 +936,6 @@ class ApiActions:
             }
         }
 
-        response = self.httpRequest.post_api_request(url, headers=headers, json=payload)
+        # Created mappers come back as 201 with an empty body, so the response object itself is returned
+        response = self.httpRequest.post_api_request_raw(url, headers=headers, json=payload)
         return response
@@ -0,0 +1,84 @@
+class ApplicationIndex:
+    """
+    In-memory index of the tenant's applications by name.
+
+    Built from one paged listing of /api/applications/ (or the Inventory's copy of it), so callers
+    can decide locally whether an application has to be created, updated or left alone instead of
+    looking every application up by name. Changes made during the run are recorded with add,
+    add_projects and update so later decisions see them.
+    """
+
+    def __init__(self, applications=()):
+        self._by_name = {}
+
+        for application in applications:
+            self.add(application)
+
+    @classmethod
+    def load(cls, api_actions, token, base_url, endpoint, page_size=100):
+        """List every application once. Returns None if the listing failed."""
+
+        applications = api_actions.get_checkmarx_applications(token, base_url, endpoint, page_size=page_size)
+        if applications is None:
+            return None
+
+        return cls(applications)
+
+    def __contains__(self, app_name):
+        return app_name in self._by_name
+
+    def __len__(self):
+        return len(self._by_name)
+
+    def add(self, application):
+        self._by_name[application.get("name")] = {
+            "id": application.get("id"),
+            "name": application.get("name"),
+            "tags": dict(application.get("tags") or {}),
+            "criticality": application.get("criticality"),
+            "projectIds": set(application.get("projectIds") or [])
+        }
+
+    def get(self, app_name):
+        """The indexed application (id, name, tags, criticality, projectIds) or None."""
+        return self._by_name.get(app_name)
+
+    def add_projects(self, app_name, project_ids):
+        application = self._by_name.get(app_name)
+        if application:
+            application["projectIds"].update(project_ids)
+
+    def update(self, app_name, tags=None, criticality=None):
+        application = self._by_name.get(app_name)
+        if not application:
+            return
+
+        if tags is not None:
+            application["tags"] = dict(tags)
+        if criticality is not None:
+            application["criticality"] = criticality
+
+    def diff(self, app_name, tags, criticality, project_ids):
+        """
+        What has to be sent to bring an existing application to the desired state:
+        tags and criticality only when they differ (None otherwise) and only the projects it does not contain yet.
+        """
+
+        application = self._by_name.get(app_name)
+        if not application:
+            return None
+
+        return {
+            "tags": tags if application["tags"] != tags else None,
+            "criticality": criticality if application["criticality"] != criticality else None,
+            "projectIds": [project_id for project_id in dict.fromkeys(project_ids) if project_id not in application["projectIds"]]
+        }
+
+    def is_up_to_date(self, app_name, tags, criticality, project_ids):
+        """True if the application exists with exactly these tags and criticality and already contains every project."""
+
+        changes = self.diff(app_name, tags, criticality, project_ids)
+        if changes is None:
+            return False
+
+        return changes["tags"] is None and changes["criticality"] is None and not changes["projectIds"]
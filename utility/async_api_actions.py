@@ -0,0 +1,126 @@
+from utility.api_actions import ApiActions
+
+import asyncio
+
+class AsyncApiActions:
+    """
+    Async counterpart of ApiActions.
+
+    Every coroutine mirrors the ApiActions method of the same name (same parameters, same return
+    values, same error handling) and runs it on a worker thread of the AsyncHttpRequests transport,
+    so it counts against the transport's in-flight limit.
+    """
+
+    def __init__(self, asyncHttpRequest, logger=None, api_actions=None):
+        self.asyncHttpRequest = asyncHttpRequest
+        self.logger = logger
+        self.api_actions = api_actions or ApiActions(asyncHttpRequest.httpRequest, logger=logger)
+
+    async def _call(self, method_name, *args, **kwargs):
+        method = getattr(self.api_actions, method_name)
+        return await self.asyncHttpRequest.run(method, *args, **kwargs)
+
+    async def gather(self, *coroutines):
+        """Await several calls concurrently and return their results in order."""
+        return await asyncio.gather(*coroutines)
+
+    async def get_access_token(self, token, base_url, endpoint):
+        return await self._call("get_access_token", token, base_url, endpoint)
+
+    async def get_valid_token(self, token, base_url, endpoint):
+        return await self._call("get_valid_token", token, base_url, endpoint)
+
+    async def get_checkmarx_projects(self, token, base_url, endpoint, empty_tag="false", project_name=None, page_size=100, max_workers=4):
+        return await self._call("get_checkmarx_projects", token, base_url, endpoint, empty_tag=empty_tag, project_name=project_name,
+                                page_size=page_size, max_workers=max_workers)
+
+    async def get_project_by_id(self, token, base_url, endpoint):
+        return await self._call("get_project_by_id", token, base_url, endpoint)
+
+    async def delete_checkmarx_project(self, token, base_url, endpoint):
+        return await self._call("delete_checkmarx_project", token, base_url, endpoint)
+
+    async def update_project_repo_protected_branches(self, token, base_url, endpoint, repo_info, project_id, new_branches, raise_errors=False):
+        return await self._call("update_project_repo_protected_branches", token, base_url, endpoint, repo_info, project_id, new_branches,
+                                raise_errors=raise_errors)
+
+    async def get_repo_branches(self, token, base_url, endpoint):
+        return await self._call("get_repo_branches", token, base_url, endpoint)
+
+    async def get_project_repo_info(self, token, base_url, endpoint):
+        return await self._call("get_project_repo_info", token, base_url, endpoint)
+
+    async def get_projects_by_tags(self, token, base_url, endpoint, tag, offset=0, limit=100):
+        return await self._call("get_projects_by_tags", token, base_url, endpoint, tag, offset, limit)
+
+    async def get_projects_through_searchbar(self, token, base_url, endpoint, search_term, offset=0, limit=100):
+        return await self._call("get_projects_through_searchbar", token, base_url, endpoint, search_term, offset, limit)
+
+    async def update_project(self, token, base_url, endpoint, project, fields):
+        return await self._call("update_project", token, base_url, endpoint, project, fields)
+
+    async def replace_project_tags(self, token, base_url, endpoint, project, tags_dict):
+        return await self._call("replace_project_tags", token, base_url, endpoint, project, tags_dict)
+
+    async def update_project_tags_and_criticality(self, token, base_url, endpoint, project, criticality, tags_dict):
+        return await self._call("update_project_tags_and_criticality", token, base_url, endpoint, project, criticality, tags_dict)
+
+    async def update_project_primary_branch(self, token, base_url, endpoint, project, main_branch):
+        return await self._call("update_project_primary_branch", token, base_url, endpoint, project, main_branch)
+
+    async def update_application_tags_and_criticality(self, token, base_url, endpoint, criticality, tags_dict):
+        return await self._call("update_application_tags_and_criticality", token, base_url, endpoint, criticality, tags_dict)
+
+    async def create_application(self, token, base_url, endpoint, app_name, tags_dict, criticality):
+        return await self._call("create_application", token, base_url, endpoint, app_name, tags_dict, criticality)
+
+    async def add_projects_to_application(self, token, base_url, endpoint, project_ids):
+        return await self._call("add_projects_to_application", token, base_url, endpoint, project_ids)
+
+    async def get_application_by_name(self, token, base_url, endpoint, app_name):
+        return await self._call("get_application_by_name", token, base_url, endpoint, app_name)
+
+    async def get_checkmarx_applications(self, token, base_url, endpoint, page_size=100):
+        return await self._call("get_checkmarx_applications", token, base_url, endpoint, page_size=page_size)
+
+    async def get_application_by_id(self, token, base_url, endpoint):
+        return await self._call("get_application_by_id", token, base_url, endpoint)
+
+    async def get_application_by_tag(self, token, base_url, endpoint, tag, offset, limit):
+        return await self._call("get_application_by_tag", token, base_url, endpoint, tag, offset, limit)
+
+    async def get_client_by_client_name(self, token, base_url, endpoint, client_name):
+        return await self._call("get_client_by_client_name", token, base_url, endpoint, client_name)
+
+    async def get_role(self, token, base_url, endpoint, role):
+        return await self._call("get_role", token, base_url, endpoint, role)
+
+    async def get_group(self, token, base_url, endpoint, group=None):
+        return await self._call("get_group", token, base_url, endpoint, group)
+
+    async def get_all_groups(self, token, base_url, endpoint, page_size=100):
+        return await self._call("get_all_groups", token, base_url, endpoint, page_size=page_size)
+
+    async def create_group(self, token, base_url, endpoint, group):
+        return await self._call("create_group", token, base_url, endpoint, group)
+
+    async def partial_import(self, token, base_url, endpoint, groups, if_resource_exists="SKIP"):
+        return await self._call("partial_import", token, base_url, endpoint, groups, if_resource_exists)
+
+    async def assign_group_role(self, token, base_url, endpoint, role_id, role):
+        return await self._call("assign_group_role", token, base_url, endpoint, role_id, role)
+
+    async def assign_group_to_resource(self, token, base_url, endpoint, group_id, resource_id, resource_type):
+        return await self._call("assign_group_to_resource", token, base_url, endpoint, group_id, resource_id, resource_type)
+
+    async def get_entity_assignments(self, token, base_url, endpoint, entity_id, entity_type="group"):
+        return await self._call("get_entity_assignments", token, base_url, endpoint, entity_id, entity_type)
+
+    async def get_identity_providers(self, token, base_url, endpoint):
+        return await self._call("get_identity_providers", token, base_url, endpoint)
+
+    async def get_mappers(self, token, base_url, endpoint):
+        return await self._call("get_mappers", token, base_url, endpoint)
+
+    async def create_mapper(self, token, base_url, endpoint, group_name, idp_alias):
+        return await self._call("create_mapper", token, base_url, endpoint, group_name, idp_alias)
@@ -0,0 +1,67 @@
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from utility.http_utility import HttpRequests
+
+import asyncio
+
+class AsyncHttpRequests:
+    """
+    Asyncio front end over the pooled, blocking HttpRequests sessions.
+
+    This is thread offload, not non-blocking I/O: each call is awaited on the event loop while the
+    blocking request runs on one of max_in_flight worker threads, so -max_in_flight 10 means up to
+    10 OS threads. An asyncio.Semaphore bounds the requests in flight, and the connection pool and
+    the worker pool are both sized to that limit. Its throughput is therefore that of a thread pool
+    of the same size.
+
+    Every request still goes through the HttpRequests RateLimiter, so once the tenant throttles,
+    raising max_in_flight beyond what the limiter's rate allows only adds idle threads.
+    """
+
+    def __init__(self, max_in_flight=10, httpRequest=None, rate=None, max_rate=None):
+        self.max_in_flight = max_in_flight
+        self.httpRequest = httpRequest or HttpRequests(pool_connections=2, pool_maxsize=max_in_flight, rate=rate, max_rate=max_rate)
+
+        self._executor = ThreadPoolExecutor(max_workers=max_in_flight, thread_name_prefix="cx-async-http")
+        self._semaphore = None
+
+    def _get_semaphore(self):
+        # Created lazily so it binds to the running event loop
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_in_flight)
+        return self._semaphore
+
+    async def run(self, func, *args, **kwargs):
+        """Run any blocking callable under the in-flight limit."""
+
+        async with self._get_semaphore():
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(self._executor, partial(func, *args, **kwargs))
+
+    async def post_api_request(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.post_api_request, url, headers=headers, data=data, params=params, json=json)
+
+    async def post_api_request_raw(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.post_api_request_raw, url, headers=headers, data=data, params=params, json=json)
+
+    async def get_api_request(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.get_api_request, url, headers=headers, data=data, params=params, json=json)
+
+    async def patch_api_request(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.patch_api_request, url, headers=headers, data=data, params=params, json=json)
+
+    async def delete_api_request(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.delete_api_request, url, headers=headers, data=data, params=params, json=json)
+
+    async def put_api_request(self, url, headers=None, data=None, params=None, json=None):
+        return await self.run(self.httpRequest.put_api_request, url, headers=headers, data=data, params=params, json=json)
+
+    def get_connection_stats(self):
+        return self.httpRequest.get_connection_stats()
+
+    def log_connection_stats(self, logger=None):
+        self.httpRequest.log_connection_stats(logger)
+
+    def close(self):
+        self._executor.shutdown(wait=True)
+        self.httpRequest.close()
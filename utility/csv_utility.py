@@ -1,8 +1,11 @@
+from collections import namedtuple
 from datetime import datetime
 from utility.helper_functions import HelperFunctions
 
 import csv
+import keyword
 import os
+import re
 
 class Csv:
 
@@ -10,28 +13,92 @@ class Csv:
     def read_csv(file_path, column_index=0):
         
         """Reads a CSV file and returns values from the specified column."""
-        extracted_data = []
-        
+        return Csv.read_csv_columns(file_path, [column_index])[0]
+
+    @staticmethod
+    def _clean_value(value):
+        # Strips the value and replaces it with "UNREADABLE" if it contains non-printable characters
+        row_value = value.strip()
+
+        if HelperFunctions.is_readable(row_value):
+            return row_value
+
+        print(f"Skipping unreadable value: {row_value}")
+        return "UNREADABLE"
+
+    @staticmethod
+    def _resolve_columns(headers, columns):
+        # Columns are given as indexes or header names (case-insensitive, surrounding spaces ignored)
+        header_index = {}
+        for index, header in enumerate(headers or []):
+            header_index.setdefault(header.strip().lower(), index)
+
+        resolved = []
+        for column in columns:
+            if isinstance(column, int):
+                resolved.append(column)
+            elif column.strip().lower() in header_index:
+                resolved.append(header_index[column.strip().lower()])
+            else:
+                raise ValueError(f"Column '{column}' not found in CSV headers {headers}")
+
+        return resolved
+
+    @staticmethod
+    def _row_type(headers, column_indexes):
+        # Row records are named after the column headers, e.g. "Repo Name" -> repo_name; columns without a header are column_<index>
+        field_names = []
+        for index in column_indexes:
+            header = headers[index] if headers and index < len(headers) else ""
+            field_name = re.sub(r"\W+", "_", header.strip().lower()).strip("_")
+
+            if not field_name or field_name[0].isdigit() or keyword.iskeyword(field_name) or field_name in field_names:
+                field_name = f"column_{index}"
+
+            field_names.append(field_name)
+
+        return namedtuple("CsvRow", field_names)
+
+    @staticmethod
+    def iter_csv_rows(file_path, columns):
+        """
+        Reads a CSV file once and yields one record per row with the values of the requested columns,
+        given as indexes or header names. Records are namedtuples whose fields are named after the headers
+        and also unpack by position; columns a row does not reach are None.
+
+        A column name missing from the headers raises ValueError. A file that cannot be read is reported and yields nothing.
+        """
+
         try:
-            with open(file_path, mode='r', newline='') as csvfile:
-                reader = csv.reader(csvfile)
-                headers = next(reader, None)  # Store headers if needed
-                
-                for row in reader:
-                    if row and len(row) > column_index:  # Ensure row has enough columns
-                        row_value = row[column_index].strip()
-                        is_readable = HelperFunctions.is_readable(row_value)
-
-                        if is_readable:
-                            extracted_data.append(row_value)  # Extract desired column
-                        else:
-                            extracted_data.append("UNREADABLE")
-                            print(f"Skipping unreadable value: {row_value}")
-                            continue
-        
-        except Exception as e:
+            csvfile = open(file_path, mode='r', newline='')
+        except OSError as e:
             print(f"Error reading CSV file: {e}")
-        
+            return
+
+        with csvfile:
+            reader = csv.reader(csvfile)
+            headers = next(reader, None)
+            column_indexes = Csv._resolve_columns(headers, columns)
+            row_type = Csv._row_type(headers, column_indexes)
+
+            for row in reader:
+                if row:
+                    yield row_type(*(Csv._clean_value(row[index]) if len(row) > index else None for index in column_indexes))
+
+    @staticmethod
+    def read_csv_columns(file_path, columns):
+        """
+        Reads a CSV file once and returns one list per requested column (indexes or header names).
+        Each list matches what read_csv returns for that column on its own.
+        """
+
+        extracted_data = [[] for _ in columns]
+
+        for values in Csv.iter_csv_rows(file_path, columns):
+            for column_data, value in zip(extracted_data, values):
+                if value is not None:
+                    column_data.append(value)
+
         return extracted_data
     
     @staticmethod
@@ -53,10 +120,10 @@ class Csv:
         print(f"Filtered Scan Details saved to {filepath}")
 
     @staticmethod
-    def get_latest_csv(directory):
-        """Finds the most recent CSV file in the specified directory."""
+    def get_latest_csv(directory, suffix=".csv"):
+        """Finds the most recent CSV file in the specified directory, optionally only among files ending with suffix."""
         try:
-            files = [f for f in os.listdir(directory) if f.endswith(".csv")]
+            files = [f for f in os.listdir(directory) if f.endswith(suffix)]
             if not files:
                 raise FileNotFoundError("No CSV files found in the directory.")
 
@@ -65,4 +132,31 @@ class Csv:
             return os.path.join(directory, latest_file)  # Return full path
         except Exception as e:
             print(f"Error finding latest CSV: {e}")
-            return None
\ No newline at end of file
+            return None
+
+    @staticmethod
+    def read_retry_items(retry_from, directory, column, suffix=".csv", where=None):
+        """
+        Reads the items to retry from an error CSV written by a previous run.
+        retry_from is the file path, or "latest" for the most recent matching file in directory.
+        where optionally maps other columns to the value a row must have, e.g. {"status": "failed"}.
+        Returns the set of values of the given column, or None if no file could be read.
+        """
+
+        file_path = Csv.get_latest_csv(directory, suffix) if retry_from == "latest" else retry_from
+
+        if not file_path or not os.path.exists(file_path):
+            print(f"No error file to retry from: {file_path or directory}")
+            return None
+
+        print(f"Retrying the items listed in {file_path}")
+
+        where = where or {}
+        conditions = list(where.items())
+        items = set()
+
+        for row in Csv.iter_csv_rows(file_path, [column] + [condition_column for condition_column, _ in conditions]):
+            if row[0] and all(value == expected for value, (_, expected) in zip(row[1:], conditions)):
+                items.add(row[0])
+
+        return items
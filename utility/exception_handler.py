@@ -2,48 +2,87 @@ import requests
 import time
 
 class ExceptionHandler:
+
+    @staticmethod
+    def _call(func, args, kwargs):
+        # Transient failures are retried per request by the RetryPolicy attached to the HttpRequests instance
+        self = args[0] if args else None
+        token_manager = getattr(self, 'token_manager', None)
+
+        try:
+            return func(*args, **kwargs)
+
+        except requests.exceptions.HTTPError as err:
+            # A 401 on a token issued by the TokenManager: re-authenticate once and replay with the new token
+            rejected = err.response is not None and err.response.status_code == 401
+            token = args[1] if len(args) > 1 else None
+
+            if not (rejected and token_manager and token_manager.owns(token)):
+                raise
+
+            args = (self, token_manager.refresh_after_unauthorized(token)) + tuple(args[2:])
+
+            return func(*args, **kwargs)
+
     @staticmethod
     def handle_exception(func):
-        def wrapper(*args, **kwargs):
+        # Errors are printed and turned into None. Callers that need to tell a failed write from a
+        # successful one (writes often return None on success too) pass raise_errors=True to get the exception
+        def wrapper(*args, raise_errors=False, **kwargs):
             try:
-                return func(*args, **kwargs)
+                return ExceptionHandler._call(func, args, kwargs)
             except requests.exceptions.HTTPError as err:
                 print("HTTP Error:", err)
+                if raise_errors:
+                    raise
                 return None
             except requests.exceptions.RequestException as e:
                 print(f"RequestException error occurred: {e}")
+                if raise_errors:
+                    raise
                 return None
             except Exception as err:
                 print("An unexpected error occurred:", err)
+                if raise_errors:
+                    raise
                 return None
         return wrapper
-    
+
     @staticmethod
     def handle_exception_with_retries(retries=1, delay=1.3):
         def decorator(func):
-            def wrapper(*args, **kwargs):
+            def wrapper(*args, raise_errors=False, **kwargs):
                 self = args[0]  # the first arg of a class method is 'self'
                 logger = getattr(self, 'logger', None)
 
+                # The RetryPolicy already retries each request's transient errors with backoff, so only one pass is made here
+                attempts = 1 if getattr(self, 'retry_policy', None) else retries
+
                 attempt = 0
-                while attempt < retries:
+                while attempt < attempts:
                     try:
-                        return func(*args, **kwargs)
+                        return ExceptionHandler._call(func, args, kwargs)
                     except requests.exceptions.HTTPError as err:
                         msg = f"HTTP Error: {err}"
+                        last_error = err
                     except requests.exceptions.RequestException as err:
                         msg = f"RequestException error occurred: {err}"
+                        last_error = err
                     except Exception as err:
                         msg = f"An unexpected error occurred: {err}"
+                        last_error = err
 
                     attempt += 1
                     if logger:
-                        logger.error(f"{msg} | Retry {attempt}/{retries}")
+                        logger.error(f"{msg} | Retry {attempt}/{attempts}")
                     else:
-                        print(f"{msg} | Retry {attempt}/{retries}")
+                        print(f"{msg} | Retry {attempt}/{attempts}")
 
-                    if attempt < retries:
+                    if attempt < attempts:
                         time.sleep(delay)
+
+                if raise_errors:
+                    raise last_error
                 return None
             return wrapper
-        return decorator
\ No newline at end of file
+        return decorator
@@ -0,0 +1,77 @@
+import threading
+
+class GroupDirectory:
+    """
+    In-memory copy of the IAM realm's groups.
+
+    The realm's groups are listed once (load) with their client role mappings, so the group
+    scripts resolve names, IDs and role mappings with dict lookups instead of one exact-search
+    call per CSV row. Groups created or mapped during the run are added with add_group and
+    add_client_role so the directory stays correct until the end of the run.
+
+    Only top-level groups are indexed; the group scripts create and look up top-level groups only.
+    """
+
+    def __init__(self, api_actions, base_url, endpoint, page_size=100, logger=None):
+        self.api_actions = api_actions
+        self.base_url = base_url
+        self.endpoint = endpoint
+        self.page_size = page_size
+        self.logger = logger
+
+        self._groups = {}
+        self._lock = threading.Lock()
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+        else:
+            print(message)
+
+    def load(self, token):
+        """List every group once. Returns False if the groups could not be retrieved."""
+
+        self._log("Loading IAM groups...")
+        groups = self.api_actions.get_all_groups(token, self.base_url, self.endpoint, page_size=self.page_size)
+
+        if groups is None:
+            self._log("Failed to load IAM groups")
+            return False
+
+        with self._lock:
+            self._groups = {}
+            for group in groups:
+                self._groups.setdefault(group.get("name"), {
+                    "id": group.get("id"),
+                    "clientRoles": {client: set(roles) for client, roles in (group.get("clientRoles") or {}).items()}
+                })
+
+        self._log(f"Loaded {len(self._groups)} IAM groups")
+        return True
+
+    def __contains__(self, group_name):
+        return group_name in self._groups
+
+    def __len__(self):
+        return len(self._groups)
+
+    def get_group_id(self, group_name):
+        group = self._groups.get(group_name)
+        return group["id"] if group else None
+
+    def get_client_roles(self, group_name, client_name="ast-app"):
+        group = self._groups.get(group_name)
+        return set(group["clientRoles"].get(client_name, ())) if group else set()
+
+    def has_client_role(self, group_name, role, client_name="ast-app"):
+        return role in self.get_client_roles(group_name, client_name)
+
+    def add_group(self, group_name, group_id):
+        with self._lock:
+            self._groups.setdefault(group_name, {"id": group_id, "clientRoles": {}})
+
+    def add_client_role(self, group_name, role, client_name="ast-app"):
+        with self._lock:
+            group = self._groups.get(group_name)
+            if group:
+                group["clientRoles"].setdefault(client_name, set()).add(role)
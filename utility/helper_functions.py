@@ -1,44 +1,50 @@
 from utility.json_file_utility import JSONFile
+from utility.lbu_matcher import LbuMatcher
+
+from datetime import datetime, timezone
 
-import string
 import re
 import csv
 
 class HelperFunctions:
+
+    # Project names look like <org>/<segment>-<project code>-<rest>, e.g. pru-gtpt/abc-24X-service
+    PROJECT_NAME_PREFIX_PATTERN = re.compile(r"[\w\-\/]+")
+    PROJECT_CODE_PATTERN = re.compile(r"\/\w+-(\w+)-[\w\-]")
+
+    # Any character outside string.printable (ASCII 0x20-0x7E plus whitespace)
+    UNPRINTABLE_PATTERN = re.compile(r"[^\x20-\x7e\t\n\r\x0b\x0c]")
     
     @staticmethod
     def get_lbu_name(app_name, json_file="lbu.json"):
-
-        # Read JSON file and extract the LBU list
-        lbu_data = JSONFile.read_json_file(json_file)
-        lbu_list = lbu_data.get("lbu", [])
-
-        # Search for LBU in project name
-        for lbu in lbu_list:
-            if lbu.lower() in app_name.lower():
-                return lbu 
-        
-        return "Pru"
+        # First LBU from the JSON list contained in the name; the list is parsed once and cached by LbuMatcher
+        return LbuMatcher.load(json_file).find_substring(app_name)
     
     @staticmethod
     def get_lbu_name_v2(app_name, json_file="lbu.json"):
-        lbu_data = JSONFile.read_json_file(json_file)
-        lbu_list = lbu_data.get("lbu", [])
+        # The segment right after "pru-" if it is a known LBU, otherwise whole-word matching on the name
+        return LbuMatcher.load(json_file).find(app_name)
 
-        # Extract the segment right after "pru-"
-        match = re.search(r'^pru-([\w]+)', app_name, re.IGNORECASE)
-        if match:
-            lbu_candidate = match.group(1).upper()
-            if lbu_candidate in [l.upper() for l in lbu_list]:
-                return lbu_candidate
+    @staticmethod
+    def extract_project_codes(project_name):
+        """
+        Returns the upper-cased project codes found in a project name, parsed once with precompiled patterns.
+        A code matches exactly when the per-code regex ^[\w\-\/]+\/([\w]+)-(<code>)-[\w\-]+ would match.
+        """
 
-        # If not found using prefix, fallback to whole-word matching
-        for lbu in lbu_list:
-            pattern = r'(?i)(?:^|[-/_])' + re.escape(lbu) + r'(?:$|[-/_])'
-            if re.search(pattern, app_name):
-                return lbu
+        prefix = HelperFunctions.PROJECT_NAME_PREFIX_PATTERN.match(project_name or "")
+        if not prefix:
+            return []
 
-        return "Pru"
+        codes = []
+
+        # The slash cannot be the first character, hence the search starts at position 1
+        for match in HelperFunctions.PROJECT_CODE_PATTERN.finditer(prefix.group(0), 1):
+            code = match.group(1).upper()
+            if code not in codes:
+                codes.append(code)
+
+        return codes
 
     @staticmethod
     def get_lbu_name_simple(app_name):
@@ -52,12 +58,26 @@ class HelperFunctions:
         
         return "Pru"
 
+    @staticmethod
+    def parse_timestamp(value):
+        # Parses the API's ISO-8601 timestamps (e.g. 2024-05-01T08:15:30.123456Z) into aware datetimes
+        if not value:
+            return None
+
+        try:
+            timestamp = datetime.fromisoformat(value.replace("Z", "+00:00"))
+        except ValueError:
+            return None
+
+        if timestamp.tzinfo is None:
+            timestamp = timestamp.replace(tzinfo=timezone.utc)
+
+        return timestamp
+
     @staticmethod
     def is_readable(text):
-        # Check if all characters in a string are readable (printable)
-        if all(char in string.printable for char in text):
-            return True
-        return False
+        # Check if all characters in a string are readable (printable), i.e. in string.printable
+        return HelperFunctions.UNPRINTABLE_PATTERN.search(text) is None
 
     @staticmethod
     def get_groups_name_list(file_name):
@@ -1,12 +1,157 @@
+from requests.adapters import HTTPAdapter
+from urllib.parse import urlsplit
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from utility.rate_limiter import RateLimiter
+
 import requests
+import threading
 import sys
 
 class HttpRequests:
 
+    def __init__(self, pool_connections=10, pool_maxsize=10, rate_limiter=None, retry_policy=None, rate=None, max_rate=None):
+        # One keep-alive session per host (tenant and IAM), so the TCP/TLS handshake is paid once per pooled connection
+        self.pool_connections = pool_connections
+        self.pool_maxsize = pool_maxsize
+
+        # Shared by every thread using this instance; replaces the fixed sleeps the scripts used for pacing.
+        # Unless rate is given, requests are only paced once the tenant answers with 429/503 or Retry-After
+        self.rate_limiter = rate_limiter or RateLimiter(rate=rate, max_rate=max_rate)
+
+        # When set (see RetryPolicy.attach), every single request is retried on its own, so a failed page
+        # of a listing is fetched again instead of the whole listing
+        self.retry_policy = retry_policy
+
+        self._sessions = {}
+        self._request_counts = {}
+        self._lock = threading.Lock()
+
+    def _get_session(self, url):
+
+        host = urlsplit(url).netloc
+
+        with self._lock:
+            session = self._sessions.get(host)
+
+            if session is None:
+                session = requests.Session()
+
+                # pool_block keeps the number of sockets per host at pool_maxsize when more threads than connections are running
+                adapter = HTTPAdapter(pool_connections=self.pool_connections, pool_maxsize=self.pool_maxsize, pool_block=True)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+
+                self._sessions[host] = session
+                self._request_counts[host] = 0
+
+            self._request_counts[host] += 1
+
+        return session
+
+    def _send(self, method, url, **kwargs):
+
+        session = self._get_session(url)
+
+        self.rate_limiter.acquire()
+        response = session.request(method, url, **kwargs)
+        self.rate_limiter.record_response(response.status_code, self.parse_retry_after(response.headers.get("Retry-After")))
+
+        return response
+
+    def _send_checked(self, method, url, **kwargs):
+
+        response = self._send(method, url, **kwargs)
+
+        # Error statuses are raised here so that the RetryPolicy can decide whether to send the request again
+        if response.status_code >= 400:
+            response.raise_for_status()
+
+        return response
+
+    def _request(self, method, url, **kwargs):
+
+        if self.retry_policy:
+            return self.retry_policy.call(self._send_checked, method, url, **kwargs)
+
+        return self._send_checked(method, url, **kwargs)
+
+    @staticmethod
+    def parse_retry_after(value):
+        # Retry-After is either a number of seconds or an HTTP date
+        if not value:
+            return None
+
+        try:
+            return max(float(value), 0.0)
+        except ValueError:
+            pass
+
+        try:
+            retry_at = parsedate_to_datetime(value)
+            return max((retry_at - datetime.now(timezone.utc)).total_seconds(), 0.0)
+        except (TypeError, ValueError):
+            return None
+
+    def get_connection_stats(self):
+        """
+        Returns per-host reuse statistics: requests sent, connections opened and requests served over an already open connection.
+        """
+
+        stats = {}
+
+        with self._lock:
+            for host, session in self._sessions.items():
+                connections_opened = 0
+
+                for adapter in set(session.adapters.values()):
+                    pools = adapter.poolmanager.pools
+
+                    for key in pools.keys():
+                        pool = pools.get(key)
+                        if pool is not None:
+                            connections_opened += pool.num_connections
+
+                requests_sent = self._request_counts.get(host, 0)
+
+                stats[host] = {
+                    "requests": requests_sent,
+                    "connections_opened": connections_opened,
+                    "connections_reused": max(requests_sent - connections_opened, 0)
+                }
+
+        return stats
+
+    def log_connection_stats(self, logger=None):
+
+        messages = []
+
+        for host, stats in self.get_connection_stats().items():
+            messages.append(f"Connection stats for {host}: {stats['requests']} requests, "
+                            f"{stats['connections_opened']} connections opened, {stats['connections_reused']} reused")
+
+        rate_stats = self.rate_limiter.get_stats()
+        messages.append(f"Rate limiter: {rate_stats['current_rate']} requests/s, {rate_stats['throttled_responses']} throttled responses, "
+                        f"{rate_stats['seconds_waited']} seconds waited")
+
+        for message in messages:
+            if logger:
+                logger.info(message)
+            else:
+                print(message)
+
+    def close(self):
+
+        with self._lock:
+            for session in self._sessions.values():
+                session.close()
+
+            self._sessions.clear()
+
     def post_api_request(self, url, headers=None, data=None, params=None, json=None):
 
         # Make the request
-        response = requests.post(url, headers=headers, data=data, params=params, json=json, timeout=120)
+        response = self._request("POST", url, headers=headers, data=data, params=params, json=json, timeout=120)
 
         # Debug print statements
         # print("Request URL:", response.url)
@@ -22,10 +167,22 @@ class HttpRequests:
         else:
             response.raise_for_status()
 
+    def post_api_request_raw(self, url, headers=None, data=None, params=None, json=None):
+        # Returns the response object itself, for endpoints that answer with an empty body and a Location header
+
+        response = self._request("POST", url, headers=headers, data=data, params=params, json=json, timeout=120)
+
+        valid_status_codes = [200, 201, 204]
+
+        if response.status_code in valid_status_codes:
+            return response
+        else:
+            response.raise_for_status()
+
     def get_api_request(self, url, headers=None, data=None, params=None, json=None):
 
         # Make the request
-        response = requests.get(url, headers=headers, data=data, params=params, json=json)
+        response = self._request("GET", url, headers=headers, data=data, params=params, json=json)
 
         # Debug print statements
         # print("Request URL:", response.url)
@@ -40,11 +197,11 @@ class HttpRequests:
             return response.json()
         else:
             response.raise_for_status()
-    
+
     def patch_api_request(self, url, headers=None, data=None, params=None, json=None):
 
         # Make the request
-        response = requests.patch(url, headers=headers, data=data, params=params, json=json)
+        response = self._request("PATCH", url, headers=headers, data=data, params=params, json=json)
 
         # Debug print statements
         # print("Request URL:", response.url)
@@ -63,7 +220,7 @@ class HttpRequests:
     def delete_api_request(self, url, headers=None, data=None, params=None, json=None):
 
         # Make the request
-        response = requests.delete(url, headers=headers, data=data, params=params, json=json, timeout=360)
+        response = self._request("DELETE", url, headers=headers, data=data, params=params, json=json, timeout=360)
 
         # Debug print statements
         # print("Request URL:", response.url)
@@ -79,10 +236,10 @@ class HttpRequests:
             return None
         else:
             response.raise_for_status()
-    
+
     def put_api_request(self, url, headers=None, data=None, params=None, json=None):
-        
-        response = requests.put(url, headers=headers, data=data, params=params, json=json, timeout=120)
+
+        response = self._request("PUT", url, headers=headers, data=data, params=params, json=json, timeout=120)
 
         # Debug print statements
         # print("Request URL:", response.url)
@@ -0,0 +1,342 @@
+from utility.routes import Routes
+from utility.helper_functions import HelperFunctions
+
+from datetime import timedelta
+
+import json
+import os
+import sqlite3
+import threading
+import time
+
+class Inventory:
+    """
+    Local SQLite copy of the tenant's projects and applications.
+
+    The tenant is downloaded once (refresh) and names, tags and repo IDs are then resolved
+    through indexed local queries instead of one listing call per lookup. The copy is reused
+    across runs until it is older than ttl seconds; refresh(force=True) always re-downloads.
+
+    When the state directory is kept between runs, sync() only fetches the projects created or
+    updated since the last successful sync. It falls back to a full refresh when the listing is not
+    in update order, when the local project count no longer matches the tenant's, and in any case
+    once the last full download is older than full_sync_interval seconds.
+
+    The stored project bodies are a snapshot: a write based on one has to re-read the project first.
+    """
+
+    # Projects updated this close to the previous watermark are fetched again, in case of equal timestamps
+    SYNC_OVERLAP = timedelta(seconds=1)
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS meta (
+            key TEXT PRIMARY KEY,
+            value TEXT
+        );
+
+        CREATE TABLE IF NOT EXISTS projects (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            name_lower TEXT,
+            repo_id TEXT,
+            created_at TEXT,
+            updated_at TEXT,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_projects_name_lower ON projects (name_lower);
+        CREATE INDEX IF NOT EXISTS idx_projects_repo_id ON projects (repo_id);
+
+        CREATE TABLE IF NOT EXISTS project_tags (
+            project_id TEXT,
+            tag TEXT,
+            value TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_project_tags_tag ON project_tags (tag);
+        CREATE INDEX IF NOT EXISTS idx_project_tags_project_id ON project_tags (project_id);
+
+        CREATE TABLE IF NOT EXISTS applications (
+            id TEXT PRIMARY KEY,
+            name TEXT,
+            name_lower TEXT,
+            data TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_applications_name_lower ON applications (name_lower);
+
+        CREATE TABLE IF NOT EXISTS application_tags (
+            application_id TEXT,
+            tag TEXT,
+            value TEXT
+        );
+        CREATE INDEX IF NOT EXISTS idx_application_tags_tag ON application_tags (tag);
+        CREATE INDEX IF NOT EXISTS idx_application_tags_application_id ON application_tags (application_id);
+    """
+
+    def __init__(self, db_path="./state/inventory.db", ttl=6 * 3600, full_sync_interval=24 * 3600, logger=None):
+        self.db_path = db_path
+        self.ttl = ttl
+        self.full_sync_interval = full_sync_interval
+        self.logger = logger
+
+        directory = os.path.dirname(db_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(db_path, check_same_thread=False)
+        self._connection.executescript(self.SCHEMA)
+        self._connection.commit()
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+        else:
+            print(message)
+
+    # --- Metadata ---
+
+    def get_meta(self, key, default=None):
+        with self._lock:
+            row = self._connection.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+
+    def set_meta(self, key, value):
+        with self._lock, self._connection:
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, str(value)))
+
+    def get_age(self):
+        """Seconds since the last full download, or None if the inventory was never filled."""
+        last_refresh = self.get_meta("last_full_refresh")
+        return time.time() - float(last_refresh) if last_refresh else None
+
+    def is_stale(self):
+        age = self.get_age()
+        return age is None or age > self.ttl
+
+    # --- Refresh ---
+
+    def refresh(self, api_actions, token, tenant_url, force=False):
+        """Download all projects and applications if the local copy is missing, older than ttl, or force is set."""
+
+        if not force and not self.is_stale():
+            self._log(f"Using local inventory from {self.db_path} ({int(self.get_age())} seconds old)")
+            return True
+
+        routes = Routes()
+
+        self._log("Downloading tenant inventory...")
+        projects = api_actions.get_checkmarx_projects(token, tenant_url, routes.get_checkmarx_projects())
+        applications = api_actions.get_checkmarx_applications(token, tenant_url, routes.get_application())
+
+        if projects is None or applications is None:
+            self._log("Failed to download the tenant inventory; keeping the previous local copy")
+            return False
+
+        with self._lock, self._connection:
+            for table in ["projects", "project_tags", "applications", "application_tags"]:
+                self._connection.execute(f"DELETE FROM {table}")
+
+            self._insert_projects(projects)
+            self._insert_applications(applications)
+
+            self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("last_full_refresh", str(time.time())))
+            self._set_watermark(projects)
+
+        self._log(f"Inventory refreshed: {len(projects)} projects, {len(applications)} applications")
+        return True
+
+    def sync(self, api_actions, token, tenant_url, force=False):
+        """
+        Bring the local copy up to date with as few calls as possible:
+        - no local copy yet (or force): full refresh
+        - last full download older than full_sync_interval: full refresh
+        - otherwise: fetch only projects newer than the stored watermark, re-list applications,
+          and fall back to a full refresh if the project count differs from the tenant's
+        """
+
+        watermark = HelperFunctions.parse_timestamp(self.get_meta("sync_watermark"))
+        age = self.get_age()
+
+        if force or watermark is None or age is None:
+            return self.refresh(api_actions, token, tenant_url, force=True)
+
+        # A delta cannot see every change (e.g. edits that keep updatedAt), so the copy is rebuilt regularly
+        if age > self.full_sync_interval:
+            self._log(f"Last full download is {int(age)} seconds old; doing a full refresh")
+            return self.refresh(api_actions, token, tenant_url, force=True)
+
+        routes = Routes()
+
+        self._log(f"Fetching projects changed since {watermark.isoformat()}...")
+        delta = api_actions.get_checkmarx_projects_updated_since(token, tenant_url, routes.get_checkmarx_projects(), watermark - self.SYNC_OVERLAP)
+
+        if delta is None:
+            self._log("Delta sync not possible; doing a full refresh")
+            return self.refresh(api_actions, token, tenant_url, force=True)
+
+        applications = api_actions.get_checkmarx_applications(token, tenant_url, routes.get_application())
+        if applications is None:
+            self._log("Failed to list applications; doing a full refresh")
+            return self.refresh(api_actions, token, tenant_url, force=True)
+
+        changed_projects = delta["projects"]
+
+        with self._lock, self._connection:
+            self._insert_projects(changed_projects)
+
+            # Applications are few, so they are always replaced as a whole
+            self._connection.execute("DELETE FROM applications")
+            self._connection.execute("DELETE FROM application_tags")
+            self._insert_applications(applications)
+
+            local_count = self._connection.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+        # Deleted projects never show up in a delta; a count mismatch is the signal to start over
+        if delta["totalCount"] is not None and local_count != delta["totalCount"]:
+            self._log(f"Local inventory has {local_count} projects but the tenant reports {delta['totalCount']}; doing a full refresh")
+            return self.refresh(api_actions, token, tenant_url, force=True)
+
+        with self._lock, self._connection:
+            self._set_watermark(changed_projects)
+
+        self._log(f"Inventory synced: {len(changed_projects)} changed projects, {local_count} projects in total")
+        return True
+
+    def _set_watermark(self, projects):
+        # Must be called with self._lock held, inside a transaction. Uses the tenant's own timestamps, not the local clock.
+
+        timestamps = [HelperFunctions.parse_timestamp(project.get("updatedAt") or project.get("createdAt")) for project in projects]
+        timestamps = [timestamp for timestamp in timestamps if timestamp is not None]
+
+        if not timestamps:
+            return
+
+        row = self._connection.execute("SELECT value FROM meta WHERE key = 'sync_watermark'").fetchone()
+        current = HelperFunctions.parse_timestamp(row[0]) if row else None
+        watermark = max(timestamps + ([current] if current else []))
+
+        self._connection.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", ("sync_watermark", watermark.isoformat()))
+
+    def _insert_projects(self, projects):
+        # Must be called with self._lock held, inside a transaction
+
+        project_ids = [(project.get("id"),) for project in projects]
+        self._connection.executemany("DELETE FROM project_tags WHERE project_id = ?", project_ids)
+
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO projects (id, name, name_lower, repo_id, created_at, updated_at, data) VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [
+                (
+                    project.get("id"),
+                    project.get("name"),
+                    (project.get("name") or "").lower(),
+                    str(project["repoId"]) if project.get("repoId") is not None else None,
+                    project.get("createdAt"),
+                    project.get("updatedAt"),
+                    json.dumps(project)
+                )
+                for project in projects
+            ]
+        )
+
+        self._connection.executemany(
+            "INSERT INTO project_tags (project_id, tag, value) VALUES (?, ?, ?)",
+            [
+                (project.get("id"), tag, value)
+                for project in projects
+                for tag, value in (project.get("tags") or {}).items()
+            ]
+        )
+
+    def _insert_applications(self, applications):
+        # Must be called with self._lock held, inside a transaction
+
+        application_ids = [(application.get("id"),) for application in applications]
+        self._connection.executemany("DELETE FROM application_tags WHERE application_id = ?", application_ids)
+
+        self._connection.executemany(
+            "INSERT OR REPLACE INTO applications (id, name, name_lower, data) VALUES (?, ?, ?, ?)",
+            [
+                (application.get("id"), application.get("name"), (application.get("name") or "").lower(), json.dumps(application))
+                for application in applications
+            ]
+        )
+
+        self._connection.executemany(
+            "INSERT INTO application_tags (application_id, tag, value) VALUES (?, ?, ?)",
+            [
+                (application.get("id"), tag, value)
+                for application in applications
+                for tag, value in (application.get("tags") or {}).items()
+            ]
+        )
+
+    # --- Local updates, so the copy stays correct for the rest of the run ---
+
+    def upsert_projects(self, projects):
+        with self._lock, self._connection:
+            self._insert_projects(projects)
+
+    def remove_project(self, project_id):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM projects WHERE id = ?", (project_id,))
+            self._connection.execute("DELETE FROM project_tags WHERE project_id = ?", (project_id,))
+
+    def upsert_applications(self, applications):
+        with self._lock, self._connection:
+            self._insert_applications(applications)
+
+    # --- Lookups ---
+
+    def _query(self, sql, params=()):
+        with self._lock:
+            rows = self._connection.execute(sql, params).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def get_all_projects(self):
+        return self._query("SELECT data FROM projects ORDER BY rowid")
+
+    def get_project_count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM projects").fetchone()[0]
+
+    def get_projects_by_name(self, project_name):
+        """Case-insensitive exact name match, like the API's (?i)^name$ name-regex."""
+        return self._query("SELECT data FROM projects WHERE name_lower = ?", (project_name.lower(),))
+
+    def get_projects_by_tag(self, tag):
+        return self._query(
+            "SELECT p.data FROM projects p JOIN project_tags t ON t.project_id = p.id WHERE t.tag = ? ORDER BY p.rowid", (tag,))
+
+    def resolve_projects_by_name(self, api_actions, token, tenant_url, project_name):
+        """
+        Local name lookup. A miss falls back to the API's name-regex query, so projects created
+        after the last refresh are still found; they are then added to the local copy.
+        """
+
+        projects = self.get_projects_by_name(project_name)
+        if projects:
+            return projects
+
+        projects = api_actions.get_checkmarx_projects(token, tenant_url, Routes().get_checkmarx_projects(), project_name=project_name)
+        if projects:
+            self.upsert_projects(projects)
+
+        return projects
+
+    def get_project_by_repo_id(self, repo_id):
+        projects = self._query("SELECT data FROM projects WHERE repo_id = ?", (str(repo_id),))
+        return projects[0] if projects else None
+
+    def get_all_applications(self):
+        return self._query("SELECT data FROM applications ORDER BY rowid")
+
+    def get_applications_by_name(self, application_name):
+        return self._query("SELECT data FROM applications WHERE name_lower = ?", (application_name.lower(),))
+
+    def get_applications_by_tag(self, tag):
+        return self._query(
+            "SELECT a.data FROM applications a JOIN application_tags t ON t.application_id = a.id WHERE t.tag = ? ORDER BY a.rowid", (tag,))
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
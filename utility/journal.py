@@ -0,0 +1,125 @@
+import hashlib
+import json
+import os
+import threading
+
+class Journal:
+    """
+    Append-only record of the work items a batch script has completed, so a failed run can be resumed.
+
+    There is one journal file per script and input file content, under ./state/journal/. A changed
+    input file therefore never resumes from the journal of another version. Every completed item
+    key is appended as one line; lines are flushed and fsynced every sync_every items and on close,
+    so a killed run loses at most the last sync_every items, which the resumed run simply redoes.
+
+    With resume=False the journal of a previous run is discarded and the run starts from scratch.
+    With resume=True the completed keys are loaded into a set and is_done() is a set lookup.
+    """
+
+    def __init__(self, script_name, input_path, directory="./state/journal", resume=False, sync_every=50, logger=None):
+        self.script_name = script_name
+        self.input_path = input_path
+        self.sync_every = sync_every
+        self.logger = logger
+
+        self.input_hash = self.hash_file(input_path)
+        self.path = os.path.join(directory, f"{script_name}-{self.input_hash[:16]}.log")
+
+        self._completed = set()
+        self._unsynced = 0
+        self._lock = threading.Lock()
+
+        os.makedirs(directory, exist_ok=True)
+
+        if resume:
+            self._load()
+            self._log(f"Resuming {script_name}: {len(self._completed)} items already completed according to {self.path}")
+
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+
+        if resume and self._ends_with_partial_line():
+            # Start after the cut-off line instead of appending to it
+            self._file.write("\n")
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.info(message)
+        else:
+            print(message)
+
+    @staticmethod
+    def hash_file(file_path):
+        digest = hashlib.sha256()
+
+        with open(file_path, "rb") as file:
+            for chunk in iter(lambda: file.read(1024 * 1024), b""):
+                digest.update(chunk)
+
+        return digest.hexdigest()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, encoding="utf-8") as file:
+            for line in file:
+                try:
+                    self._completed.add(json.loads(line))
+                except ValueError:
+                    # The last line of a killed run may be cut off; that item is redone
+                    continue
+
+    def _ends_with_partial_line(self):
+        if not os.path.getsize(self.path):
+            return False
+
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) != b"\n"
+
+    def __contains__(self, key):
+        return key in self._completed
+
+    def __iter__(self):
+        return iter(list(self._completed))
+
+    def __len__(self):
+        return len(self._completed)
+
+    def is_done(self, key):
+        return key in self._completed
+
+    def mark_done(self, key):
+        with self._lock:
+            if key in self._completed:
+                return
+
+            self._completed.add(key)
+            self._file.write(json.dumps(key) + "\n")
+            self._unsynced += 1
+
+            if self._unsynced >= self.sync_every:
+                self._sync()
+
+    def _sync(self):
+        # Must be called with self._lock held
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._unsynced = 0
+
+    def flush(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+
+    def close(self):
+        with self._lock:
+            if not self._file.closed:
+                self._sync()
+                self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
@@ -0,0 +1,94 @@
+from utility.json_file_utility import JSONFile
+
+import os
+import re
+import threading
+
+class LbuMatcher:
+    """
+    Finds the LBU of a project or app name in one pass over the name.
+
+    All LBUs from the JSON file are compiled into a single alternation inside a zero-width
+    lookahead, so every position of the name is checked against every LBU at once. An alternation
+    always prefers its earliest alternative, so the LBU listed first in the file still wins,
+    exactly like the previous loop over the list.
+
+    Matchers are cached per file and rebuilt only when the file's modification time changes.
+    """
+
+    DEFAULT_LBU = "Pru"
+
+    _cache = {}
+    _cache_lock = threading.Lock()
+
+    def __init__(self, lbu_list):
+        self.lbu_list = list(lbu_list)
+
+        # Lower-cased name -> (position in the list, LBU) of the first LBU listed with that name
+        self._by_lower = {}
+        for priority, lbu in enumerate(self.lbu_list):
+            self._by_lower.setdefault(lbu.lower(), (priority, lbu))
+        self._upper = {lbu.upper() for lbu in self.lbu_list}
+
+        alternation = "|".join(re.escape(lbu.lower()) for lbu in self.lbu_list)
+        self._substring_pattern = re.compile(f"(?=({alternation}))") if self.lbu_list else None
+
+        alternation = "|".join(re.escape(lbu) for lbu in self.lbu_list)
+        self._whole_word_pattern = re.compile(f"(?:^|(?<=[-/_]))(?=({alternation})(?:$|[-/_]))", re.IGNORECASE) if self.lbu_list else None
+
+    @classmethod
+    def load(cls, json_file="lbu.json"):
+        """Return the matcher for json_file, re-reading the file only when it has changed on disk."""
+
+        path = os.path.abspath(json_file)
+        mtime = os.stat(path).st_mtime_ns
+
+        with cls._cache_lock:
+            cached = cls._cache.get(path)
+            if cached and cached[0] == mtime:
+                return cached[1]
+
+            lbu_data = JSONFile.read_json_file(path)
+            matcher = cls(lbu_data.get("lbu", []))
+            cls._cache[path] = (mtime, matcher)
+
+            return matcher
+
+    def _first_listed(self, pattern, text):
+        # Each match is the preferred LBU at one position; the overall winner is the one listed first
+        best = None
+
+        for match in pattern.finditer(text):
+            candidate = self._by_lower[match.group(1).lower()]
+
+            if best is None or candidate[0] < best[0]:
+                best = candidate
+                if best[0] == 0:
+                    break
+
+        return best[1] if best else None
+
+    def find_substring(self, app_name):
+        """First listed LBU contained anywhere in the name (case-insensitive), or Pru."""
+
+        if not self._substring_pattern:
+            return self.DEFAULT_LBU
+
+        return self._first_listed(self._substring_pattern, app_name.lower()) or self.DEFAULT_LBU
+
+    def find(self, app_name):
+        """
+        The segment right after a leading "pru-" if it is a known LBU (upper-cased), otherwise the
+        first listed LBU that appears as a whole word delimited by -, / or _, otherwise Pru.
+        """
+
+        match = re.search(r'^pru-([\w]+)', app_name, re.IGNORECASE)
+        if match:
+            lbu_candidate = match.group(1).upper()
+            if lbu_candidate in self._upper:
+                return lbu_candidate
+
+        if not self._whole_word_pattern:
+            return self.DEFAULT_LBU
+
+        return self._first_listed(self._whole_word_pattern, app_name) or self.DEFAULT_LBU
@@ -0,0 +1,107 @@
+from utility.routes import Routes
+
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import threading
+
+class ProjectWriteBuffer:
+    """
+    Collects project field changes (tags, criticality, mainBranch, ...) and sends them as one PUT
+    per project at flush time, at most max_workers at a time.
+
+    Changes staged for a project that already has pending changes are merged into its pending
+    write; a later change to the same field replaces the earlier one. flush() returns the projects
+    whose write failed, so the caller only reports the others as updated.
+    """
+
+    def __init__(self, api_actions, base_url, logger=None):
+        self.api_actions = api_actions
+        self.base_url = base_url
+        self.logger = logger
+        self.routes = Routes()
+
+        self._pending = {}
+        self._staged_count = 0
+        self._sent_count = 0
+        self._failed_count = 0
+        self._lock = threading.Lock()
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def __len__(self):
+        return len(self._pending)
+
+    def stage(self, project, **fields):
+        """Queue field changes for a project. Nothing is sent until flush()."""
+
+        with self._lock:
+            pending = self._pending.setdefault(project.get("id"), {"project": project, "fields": {}})
+            pending["fields"].update(fields)
+            self._staged_count += 1
+
+    def _write(self, project_id, pending, token):
+        token_manager = getattr(self.api_actions, "token_manager", None)
+        token = token_manager.get_token() if token_manager else token
+
+        # The staged body may come from a cached inventory, so the project is re-read and only the staged fields are changed
+        project = self.api_actions.get_project_by_id(token, self.base_url, self.routes.get_project(project_id), raise_errors=True)
+        if not project:
+            raise RuntimeError(f"Project {project_id} could not be read before updating it")
+
+        # update_project returns None on failure and on success alike, so it is asked to raise instead
+        self.api_actions.update_project(token, self.base_url, self.routes.update_projects(project_id), project, pending["fields"], raise_errors=True)
+
+    def flush(self, token=None, max_workers=4):
+        """
+        Send one PUT per pending project, at most max_workers at a time.
+        Returns the projects whose write failed, as a dict of project ID to the error.
+        """
+
+        with self._lock:
+            pending_writes = self._pending
+            self._pending = {}
+
+        failed_project_ids = {}
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._write, project_id, pending, token): project_id for project_id, pending in pending_writes.items()}
+
+            for future in as_completed(futures):
+                project_id = futures[future]
+
+                try:
+                    future.result()
+                except Exception as e:
+                    failed_project_ids[project_id] = e
+                    self._log(f"Failed to update project {pending_writes[project_id]['project'].get('name')}: {e}", level="error")
+
+        with self._lock:
+            self._sent_count += len(pending_writes) - len(failed_project_ids)
+            self._failed_count += len(failed_project_ids)
+
+        return failed_project_ids
+
+    def get_stats(self):
+        """Changes staged and PUTs sent and failed."""
+
+        with self._lock:
+            return {
+                "staged": self._staged_count,
+                "sent": self._sent_count,
+                "failed": self._failed_count
+            }
+
+    def log_stats(self, logger=None):
+
+        stats = self.get_stats()
+        message = (f"Project writes: {stats['staged']} changes staged, {stats['sent']} PUTs sent, "
+                   f"{stats['failed']} failed")
+
+        if logger or self.logger:
+            (logger or self.logger).info(message)
+        else:
+            print(message)
@@ -0,0 +1,134 @@
+import threading
+import time
+
+class RateLimiter:
+    """
+    Thread-safe token bucket shared by every request that goes through one HttpRequests instance.
+
+    By default (rate=None) requests are not paced at all until the server pushes back. The first
+    throttling status (429/503) starts pacing at decrease_factor times the rate actually observed
+    just before it; after that the refill rate adapts to the tenant (AIMD): it is cut by
+    decrease_factor on every throttling status and grows back by about increase_step requests/second
+    for every second of successful traffic. A Retry-After header pauses all requests until it expires.
+
+    rate sets a starting rate instead, and max_rate an upper bound; without max_rate there is no ceiling.
+    """
+
+    THROTTLE_STATUS_CODES = (429, 503)
+
+    def __init__(self, rate=None, min_rate=0.5, max_rate=None, burst=None, increase_step=0.5, decrease_factor=0.5, backoff_cooldown=1.0):
+        self.max_rate = float(max_rate) if max_rate else None
+        self.min_rate = float(min_rate)
+        self.rate = self._bounded(float(rate)) if rate else None
+        self.burst_setting = burst
+        self.increase_step = increase_step
+        self.decrease_factor = decrease_factor
+        self.backoff_cooldown = backoff_cooldown
+
+        self.burst = self._get_burst()
+        self._tokens = self.burst
+        self._last_refill = time.monotonic()
+        self._last_backoff = 0.0
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+        # Requests sent during the last second, used to pick a starting rate when the first throttle arrives
+        self._window_start = time.monotonic()
+        self._window_count = 0
+        self._observed_rate = 0.0
+
+        # Statistics
+        self._acquired = 0
+        self._throttled = 0
+        self._waited_seconds = 0.0
+
+    def _bounded(self, rate):
+        rate = max(self.min_rate, rate)
+        return min(self.max_rate, rate) if self.max_rate else rate
+
+    def _get_burst(self):
+        if self.burst_setting:
+            return float(self.burst_setting)
+        return max(self.rate or 1.0, 1.0)
+
+    def _refill(self, now):
+        elapsed = now - self._last_refill
+        self._last_refill = now
+
+        if self.rate is not None:
+            self._tokens = min(self.burst, self._tokens + elapsed * self.rate)
+
+    def _count_request(self, now):
+        # Must be called with self._lock held
+        elapsed = now - self._window_start
+
+        if elapsed >= 1.0:
+            self._observed_rate = self._window_count / elapsed
+            self._window_start = now
+            self._window_count = 0
+
+        self._window_count += 1
+
+    def acquire(self):
+        """Block until a request may be sent."""
+
+        started = time.monotonic()
+
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+
+                if now >= self._paused_until and (self.rate is None or self._tokens >= 1):
+                    if self.rate is not None:
+                        self._tokens -= 1
+
+                    self._count_request(now)
+                    self._acquired += 1
+                    self._waited_seconds += now - started
+                    return
+
+                wait = self._paused_until - now
+                if self.rate is not None:
+                    wait = max(wait, (1 - self._tokens) / self.rate)
+
+            time.sleep(wait)
+
+    def record_response(self, status_code, retry_after=None):
+        """Feed a response status back into the limiter so the rate tracks what the tenant allows."""
+
+        with self._lock:
+            now = time.monotonic()
+
+            if status_code in self.THROTTLE_STATUS_CODES:
+                self._throttled += 1
+
+                # Requests already in flight will all come back throttled; only back off once per cooldown window
+                if now - self._last_backoff >= self.backoff_cooldown:
+                    self._last_backoff = now
+
+                    if self.rate is None:
+                        current_rate = max(self._observed_rate, self._window_count / max(now - self._window_start, 1.0))
+                        self.rate = self._bounded(current_rate * self.decrease_factor)
+                        self.burst = self._get_burst()
+                    else:
+                        self.rate = self._bounded(self.rate * self.decrease_factor)
+
+                    self._tokens = 0
+                    self._last_refill = now
+
+                if retry_after:
+                    self._paused_until = max(self._paused_until, now + retry_after)
+
+            elif status_code < 400 and self.rate is not None:
+                self.rate = self._bounded(self.rate + self.increase_step / self.rate)
+
+    def get_stats(self):
+
+        with self._lock:
+            return {
+                "current_rate": round(self.rate, 2) if self.rate is not None else "unlimited",
+                "requests": self._acquired,
+                "throttled_responses": self._throttled,
+                "seconds_waited": round(self._waited_seconds, 2)
+            }
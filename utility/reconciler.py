@@ -0,0 +1,300 @@
+from utility.routes import Routes
+
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import threading
+import time
+
+class Mutation:
+    """One write in a plan: the ApiActions method to call and its arguments after the token."""
+
+    def __init__(self, action, target, method_name, args, description=None, name=None):
+        self.action = action
+        self.target = target
+        self.name = name or target
+        self.method_name = method_name
+        self.args = args
+        self.description = description or f"{action} {target}"
+
+        self.applied = False
+        self.result = None
+        self.error = None
+
+class Plan:
+    """
+    The writes needed to move the tenant from its actual state to the desired state.
+
+    Items that are already in the desired state are only counted (unchanged), so they never
+    turn into a request.
+    """
+
+    def __init__(self):
+        self.mutations = []
+        self.unchanged = 0
+
+    def __len__(self):
+        return len(self.mutations)
+
+    def add(self, action, target, method_name, *args, description=None, name=None):
+        mutation = Mutation(action, target, method_name, args, description, name)
+        self.mutations.append(mutation)
+        return mutation
+
+    def add_unchanged(self, count=1):
+        self.unchanged += count
+
+    def extend(self, other):
+        self.mutations.extend(other.mutations)
+        self.unchanged += other.unchanged
+
+    def summary(self):
+        """Number of planned writes per action, plus the number of unchanged items."""
+        counts = dict(Counter(mutation.action for mutation in self.mutations))
+        counts["unchanged"] = self.unchanged
+        return counts
+
+    def print_plan(self, logger=None):
+
+        messages = [f"[plan] {mutation.description}" for mutation in self.mutations]
+        messages.append(f"[plan] {len(self.mutations)} writes planned, {self.unchanged} items already up to date: {self.summary()}")
+
+        for message in messages:
+            if logger:
+                logger.info(message)
+            else:
+                print(message)
+
+class Reconciler:
+    """
+    Plan/apply layer over ApiActions.
+
+    The plan_* methods compare a desired state with the actual state the script fetched and add a
+    mutation to the plan only when they differ. apply() then prints the plan (dry run) or sends it
+    with at most max_workers requests in flight. Mutations on the same target are sent in order,
+    one after the other; different targets are sent concurrently.
+    """
+
+    def __init__(self, api_actions, base_url, max_workers=4, logger=None):
+        self.api_actions = api_actions
+        self.base_url = base_url
+        self.max_workers = max_workers
+        self.logger = logger
+        self.routes = Routes()
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    # --- Diffing ---
+
+    def plan_project_tags(self, plan, project, desired_tags):
+        if (project.get("tags") or {}) == desired_tags:
+            plan.add_unchanged()
+            return None
+
+        return plan.add("replace_tags", project.get("id"), "replace_project_tags",
+                        self.base_url, self.routes.update_projects(project.get("id")), project, desired_tags,
+                        description=f"replace tags of {project.get('name')}: {project.get('tags')} -> {desired_tags}", name=project.get("name"))
+
+    def plan_primary_branch(self, plan, project, primary_branch):
+        if project.get("mainBranch") == primary_branch:
+            plan.add_unchanged()
+            return None
+
+        return plan.add("set_primary_branch", project.get("id"), "update_project_primary_branch",
+                        self.base_url, self.routes.update_projects(project.get("id")), project, primary_branch,
+                        description=f"set primary branch of {project.get('name')}: {project.get('mainBranch')} -> {primary_branch}", name=project.get("name"))
+
+    def plan_protected_branches(self, plan, project, repo_info, branches):
+        protected_branch_names = set(branch["name"] for branch in (repo_info.get("branches") or []))
+
+        if set(branches).issubset(protected_branch_names):
+            plan.add_unchanged()
+            return None
+
+        return plan.add("protect_branches", project.get("id"), "update_project_repo_protected_branches",
+                        self.base_url, self.routes.get_project_repo(project.get("repoId")), repo_info, project.get("id"), branches,
+                        description=f"protect branches of {project.get('name')}: {sorted(set(branches) - protected_branch_names)}", name=project.get("name"))
+
+    def plan_project_delete(self, plan, project):
+        if not project:
+            plan.add_unchanged()
+            return None
+
+        return plan.add("delete_project", project.get("id"), "delete_checkmarx_project",
+                        self.base_url, self.routes.delete_project(project.get("id")),
+                        description=f"delete project {project.get('name')}", name=project.get("name"))
+
+    def plan_group_assignment(self, plan, group_id, resource_id, resource_type, resource_name=None, existing=None):
+        # existing: the (group ID, resource ID) pairs already assigned, when the caller has loaded them
+        if existing is not None and (group_id, resource_id) in existing:
+            plan.add_unchanged()
+            return None
+
+        return plan.add("assign_group", resource_id, "assign_group_to_resource",
+                        self.base_url, self.routes.assign_group_to_resource(), group_id, resource_id, resource_type,
+                        description=f"assign group {group_id} to {resource_type} {resource_name or resource_id}", name=resource_name)
+
+    # --- Applying ---
+
+    def _get_token(self, token):
+        token_manager = getattr(self.api_actions, "token_manager", None)
+        return token_manager.get_token() if token_manager else token
+
+    def apply_mutation(self, mutation, token=None):
+        """Send a single mutation. Returns True if it was applied."""
+
+        try:
+            # ApiActions methods return None on failure as well as on many successful writes, so they are asked to raise instead
+            method = getattr(self.api_actions, mutation.method_name)
+            mutation.result = method(self._get_token(token), *mutation.args, raise_errors=True)
+            mutation.applied = True
+        except Exception as e:
+            mutation.error = e
+            self._log(f"Failed to {mutation.description}: {e}", level="error")
+
+        return mutation.applied
+
+    def _apply_target(self, mutations, token):
+        for mutation in mutations:
+            self.apply_mutation(mutation, token)
+
+    def apply(self, plan, token=None, dry_run=False):
+        """
+        Print the plan when dry_run is set, otherwise send it. Returns the number of applied,
+        failed and unchanged items. Errors that ApiActions handles itself are logged there.
+        """
+
+        if dry_run:
+            plan.print_plan(self.logger)
+            return {"applied": 0, "failed": 0, "unchanged": plan.unchanged, "planned": len(plan)}
+
+        by_target = defaultdict(list)
+        for mutation in plan.mutations:
+            by_target[mutation.target].append(mutation)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = [executor.submit(self._apply_target, mutations, token) for mutations in by_target.values()]
+            for future in as_completed(futures):
+                future.result()
+
+        applied = sum(1 for mutation in plan.mutations if mutation.applied)
+
+        return {"applied": applied, "failed": len(plan) - applied, "unchanged": plan.unchanged, "planned": len(plan)}
+
+class MutationPipeline:
+    """
+    Sends plans while the caller is still building the next ones.
+
+    submit() hands a plan's mutations to a pool of max_workers threads and returns right away,
+    so the caller can fetch the next page of resources while the previous page's writes are in
+    flight. At most max_pending mutations wait in the queue; submit() blocks beyond that, which
+    keeps fetching from running arbitrarily far ahead of the writes.
+
+    Mutations are grouped under a label (e.g. a tag). Once a label is marked done and all its
+    mutations have finished, its progress is logged; finish() waits for everything and logs the
+    overall throughput. on_applied, if given, is called from the worker thread with every
+    mutation whose write succeeded (apply_mutation returned True); failed writes never reach it.
+    """
+
+    def __init__(self, reconciler, max_workers=8, max_pending=None, dry_run=False, logger=None, on_applied=None):
+        self.reconciler = reconciler
+        self.max_workers = max_workers
+        self.dry_run = dry_run
+        self.logger = logger
+        self.on_applied = on_applied
+
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._slots = threading.BoundedSemaphore(max_pending or max_workers * 4)
+        self._lock = threading.Lock()
+        self._labels = {}
+        self._start = time.monotonic()
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def _get_label(self, label):
+        # Must be called with self._lock held
+        return self._labels.setdefault(label, {"submitted": 0, "applied": 0, "failed": 0, "unchanged": 0,
+                                               "done": False, "reported": False, "start": time.monotonic()})
+
+    def _report_if_complete(self, label, stats):
+        # Must be called with self._lock held
+        if stats["done"] and not stats["reported"] and stats["applied"] + stats["failed"] == stats["submitted"]:
+            stats["reported"] = True
+            elapsed = time.monotonic() - stats["start"]
+            self._log(f"{label}: {stats['applied']} sent, {stats['failed']} failed, {stats['unchanged']} already in place "
+                      f"in {elapsed:.1f}s")
+
+    def _run(self, label, mutation):
+        applied = False
+
+        try:
+            applied = self.reconciler.apply_mutation(mutation)
+
+            if applied and self.on_applied:
+                self.on_applied(mutation)
+        finally:
+            self._slots.release()
+
+            with self._lock:
+                stats = self._labels[label]
+                stats["applied" if applied else "failed"] += 1
+                self._report_if_complete(label, stats)
+
+    def submit(self, label, plan):
+        """Queue a plan's mutations under label. With dry_run the plan is only printed."""
+
+        with self._lock:
+            self._get_label(label)["unchanged"] += plan.unchanged
+
+        if self.dry_run:
+            plan.print_plan(self.logger)
+            return
+
+        for mutation in plan.mutations:
+            self._slots.acquire()
+
+            with self._lock:
+                self._get_label(label)["submitted"] += 1
+
+            self._executor.submit(self._run, label, mutation)
+
+    def mark_done(self, label):
+        """No more plans will be submitted under label."""
+
+        with self._lock:
+            stats = self._get_label(label)
+            stats["done"] = True
+
+            if self.dry_run:
+                stats["reported"] = True
+                return
+
+            self._report_if_complete(label, stats)
+
+    def finish(self):
+        """Wait for every queued mutation and return the totals."""
+
+        self._executor.shutdown(wait=True)
+
+        with self._lock:
+            for label, stats in self._labels.items():
+                stats["done"] = True
+                self._report_if_complete(label, stats)
+
+            totals = {key: sum(stats[key] for stats in self._labels.values()) for key in ("submitted", "applied", "failed", "unchanged")}
+
+        elapsed = time.monotonic() - self._start
+        throughput = totals["submitted"] / elapsed if elapsed > 0 else 0.0
+
+        self._log(f"Pipeline finished: {totals['applied']} sent, {totals['failed']} failed, {totals['unchanged']} already in place "
+                  f"across {len(self._labels)} labels in {elapsed:.1f}s ({throughput:.2f} writes/s with {self.max_workers} workers)")
+
+        return totals
@@ -0,0 +1,172 @@
+from utility.http_utility import HttpRequests
+
+import requests
+import random
+import threading
+import time
+
+class RetryPolicy:
+    """
+    Decides whether a failed API call is retried and how long to wait before the next attempt.
+
+    - Only transient failures are retried: connection errors, timeouts and the status codes in
+      RETRYABLE_STATUS_CODES. Client errors (400, 404, 409, ...) and programming errors fail at once.
+    - Non-idempotent requests (POST/PATCH) are only retried when the server rejected them without
+      processing them (429/503) or the connection could not be established.
+    - Delays use exponential backoff with full jitter, unless the server sent a Retry-After header.
+    - retry_budget caps the number of retries for the whole run, shared by all threads, so a tenant
+      outage degrades into fast failures instead of a retry storm.
+
+    The policy is attached to an HttpRequests instance (attach), which applies it to every single
+    request: a transient failure on one page of a listing only sends that page again.
+    """
+
+    RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+    REJECTED_STATUS_CODES = (429, 503)
+    IDEMPOTENT_METHODS = ("GET", "HEAD", "OPTIONS", "PUT", "DELETE")
+
+    def __init__(self, max_attempts=4, base_delay=1.0, max_delay=60.0, retry_budget=500, logger=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_budget = retry_budget
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._retries = 0
+        self._retry_seconds = 0.0
+        self._budget_exhausted = 0
+        self._retries_by_reason = {}
+
+    @classmethod
+    def attach(cls, httpRequest, retry_policy=None, logger=None):
+        """
+        Returns the policy used by httpRequest, attaching retry_policy (or a new policy) if it has none yet.
+        Everything sharing the HttpRequests instance then shares one policy and one retry budget.
+        """
+
+        if getattr(httpRequest, "retry_policy", None) is None:
+            httpRequest.retry_policy = retry_policy or cls(logger=logger)
+
+        return httpRequest.retry_policy
+
+    def _log(self, message):
+        if self.logger:
+            self.logger.warning(message)
+        else:
+            print(message)
+
+    @staticmethod
+    def _get_request_method(err):
+        request = getattr(err, "request", None)
+        if request is None and getattr(err, "response", None) is not None:
+            request = err.response.request
+        return (getattr(request, "method", None) or "GET").upper()
+
+    def get_retry_reason(self, err):
+        """Returns a short reason if err is worth retrying, otherwise None."""
+
+        method = self._get_request_method(err)
+        idempotent = method in self.IDEMPOTENT_METHODS
+
+        if isinstance(err, requests.exceptions.HTTPError):
+            status_code = err.response.status_code if err.response is not None else None
+
+            if status_code in self.REJECTED_STATUS_CODES:
+                return str(status_code)
+            if status_code in self.RETRYABLE_STATUS_CODES and idempotent:
+                return str(status_code)
+            return None
+
+        # Certificate and TLS errors will not go away on their own
+        if isinstance(err, requests.exceptions.SSLError):
+            return None
+
+        if isinstance(err, requests.exceptions.ConnectTimeout):
+            return type(err).__name__
+
+        if isinstance(err, (requests.exceptions.ConnectionError, requests.exceptions.Timeout, requests.exceptions.ChunkedEncodingError)):
+            return type(err).__name__ if idempotent else None
+
+        return None
+
+    @staticmethod
+    def _describe(func, err):
+        # The failed request when the error carries one, otherwise the name of the function that was called
+        request = getattr(err, "request", None)
+        if request is None and getattr(err, "response", None) is not None:
+            request = err.response.request
+
+        if getattr(request, "url", None):
+            return f"{request.method} {request.url}"
+
+        return func.__name__
+
+    def get_delay(self, attempt, err):
+
+        response = getattr(err, "response", None)
+        if response is not None:
+            retry_after = HttpRequests.parse_retry_after(response.headers.get("Retry-After"))
+            if retry_after is not None:
+                return min(retry_after, self.max_delay)
+
+        # Full jitter: spreads the retries of concurrent workers instead of synchronising them
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** (attempt - 1))))
+
+    def _consume_budget(self):
+        with self._lock:
+            if self._retries >= self.retry_budget:
+                self._budget_exhausted += 1
+                return False
+            self._retries += 1
+            return True
+
+    def call(self, func, *args, **kwargs):
+        """Call func, retrying transient failures. The last exception is re-raised when retries stop."""
+
+        attempt = 1
+
+        while True:
+            try:
+                return func(*args, **kwargs)
+            except Exception as err:
+                reason = self.get_retry_reason(err)
+
+                if reason is None or attempt >= self.max_attempts:
+                    raise
+
+                if not self._consume_budget():
+                    self._log(f"Run-wide retry budget of {self.retry_budget} exhausted, not retrying {self._describe(func, err)}: {err}")
+                    raise
+
+                delay = self.get_delay(attempt, err)
+                self._log(f"{self._describe(func, err)} failed ({reason}): {err} | Retry {attempt}/{self.max_attempts - 1} in {delay:.1f}s")
+                time.sleep(delay)
+
+                with self._lock:
+                    self._retry_seconds += delay
+                    self._retries_by_reason[reason] = self._retries_by_reason.get(reason, 0) + 1
+
+                attempt += 1
+
+    def get_stats(self):
+
+        with self._lock:
+            return {
+                "retries": self._retries,
+                "retry_seconds": round(self._retry_seconds, 2),
+                "budget_remaining": max(self.retry_budget - self._retries, 0),
+                "budget_exhausted": self._budget_exhausted,
+                "retries_by_reason": dict(self._retries_by_reason)
+            }
+
+    def log_stats(self, logger=None):
+
+        stats = self.get_stats()
+        message = (f"Retries: {stats['retries']} ({stats['retry_seconds']} seconds waited), "
+                   f"budget remaining {stats['budget_remaining']}, by reason {stats['retries_by_reason']}")
+
+        if logger:
+            logger.info(message)
+        else:
+            print(message)
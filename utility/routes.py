@@ -79,6 +79,10 @@ class Routes:
         endpoint = f"/auth/admin/realms/{tenant_name}/groups"
         return endpoint
 
+    def partial_import(self, tenant_name):
+        endpoint = f"/auth/admin/realms/{tenant_name}/partialImport"
+        return endpoint
+
     def assign_group_role(self, tenant_name, group_id, client_id):
         endpoint = f"/auth/admin/realms/{tenant_name}/groups/{group_id}/role-mappings/clients/{client_id}"
         return endpoint
@@ -87,10 +91,18 @@ class Routes:
         endpoint = "/api/access-management/"
         return endpoint
 
+    def get_entity_assignments(self):
+        endpoint = "/api/access-management/resources-for"
+        return endpoint
+
     def get_idps(self, tenant_name):
         endpoint = f"/auth/admin/realms/{tenant_name}/identity-provider/instances"
         return endpoint
 
+    def get_mappers(self, tenant_name, idp_alias):
+        endpoint = f"/auth/admin/realms/{tenant_name}/identity-provider/instances/{idp_alias}/mappers"
+        return endpoint
+
     def create_mapper(self, tenant_name, idp_alias):
         endpoint = f"/auth/admin/realms/{tenant_name}/identity-provider/instances/{idp_alias}/mappers/"
         return endpoint
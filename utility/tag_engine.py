@@ -0,0 +1,64 @@
+from collections import defaultdict
+from utility.helper_functions import HelperFunctions
+
+class TagEngine:
+    """
+    Derives the tags a project should carry from its name.
+
+    Each project name is parsed once (HelperFunctions.extract_project_codes) and the candidate codes
+    are checked against the known project codes with set lookups, instead of building and running
+    one regex per code.
+    """
+
+    FALLBACK_CODE = "PRU"
+
+    def __init__(self, project_codes, user_defined_tags=()):
+        self.project_codes = {code.upper() for code in project_codes}
+        self.user_defined_tags = {tag.upper() for tag in user_defined_tags}
+
+    def match_project_codes(self, project_name):
+        """Known project codes found in the project name."""
+        return [code for code in HelperFunctions.extract_project_codes(project_name) if code in self.project_codes]
+
+    def compute_tags(self, project):
+        """
+        Desired tags for one project:
+        - every known project code in its name, plus its LBU
+        - every user defined tag it already carries, plus its LBU
+        - otherwise the fallback code PRU, plus its LBU
+        """
+
+        project_name = project.get("name") or ""
+        project_tags = project.get("tags") or {}
+        lbu_name = HelperFunctions.get_lbu_name_simple(project_name).upper()
+
+        desired_tags = {}
+
+        for code in self.match_project_codes(project_name):
+            desired_tags[code] = ""
+            desired_tags[lbu_name] = ""
+
+        for code in self.user_defined_tags.intersection(project_tags):
+            desired_tags[code] = ""
+            desired_tags[lbu_name] = ""
+
+        if not desired_tags:
+            desired_tags[self.FALLBACK_CODE] = ""
+            desired_tags[lbu_name] = ""
+
+        return desired_tags
+
+    def compute_all(self, projects):
+        """Desired tags for every project in one pass, keyed by project ID."""
+        return {project.get("id"): self.compute_tags(project) for project in projects}
+
+    def index_projects_by_code(self, projects):
+        """Known project code -> projects whose name carries it, keeping the input order."""
+
+        projects_by_code = defaultdict(list)
+
+        for project in projects:
+            for code in self.match_project_codes(project.get("name")):
+                projects_by_code[code].append(project)
+
+        return projects_by_code
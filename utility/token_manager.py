@@ -0,0 +1,146 @@
+from urllib.parse import urlencode
+from utility.retry_policy import RetryPolicy
+
+import threading
+import time
+
+class TokenManager:
+    """
+    Owns the IAM access token for a run.
+
+    - get_token() is safe to call from any thread and before every request: it returns the cached
+      token and only refreshes when it is missing or expired, with a single refresh in flight.
+    - A background timer refreshes the token refresh_margin seconds before it expires, so workers
+      normally never wait for IAM.
+    - refresh_after_unauthorized() is used by ExceptionHandler to re-authenticate and replay a call
+      that was rejected with 401.
+    """
+
+    def __init__(self, httpRequest, refresh_token, base_url, endpoint, logger=None, refresh_margin=120, background_refresh=True, retry_policy=None):
+        self.httpRequest = httpRequest
+        self.refresh_token = refresh_token
+        self.base_url = base_url
+        self.endpoint = endpoint
+        self.logger = logger
+        self.refresh_margin = refresh_margin
+        self.background_refresh = background_refresh
+        self.retry_policy = RetryPolicy.attach(httpRequest, retry_policy, logger=logger)
+
+        self._token = None
+        self._expiry = 0
+        self._issued_tokens = set()
+        self._refresh_count = 0
+        self._timer = None
+        self._stopped = False
+        self._lock = threading.Lock()
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def _request_token(self):
+
+        url = f"https://{self.base_url}{self.endpoint}"
+
+        headers = {
+            "accept": "application/json",
+            "Content-Type": "application/x-www-form-urlencoded"
+        }
+
+        data = {
+            "grant_type": "refresh_token",
+            "client_id": "ast-app",
+            "refresh_token": self.refresh_token
+        }
+
+        # Retried by the RetryPolicy attached to httpRequest
+        return self.httpRequest.post_api_request(url, headers, urlencode(data))
+
+    def _refresh(self):
+        # Must be called with self._lock held
+
+        response = self._request_token()
+        raw_token = response.get("access_token") if response else None
+
+        if not raw_token:
+            raise RuntimeError("IAM response did not contain an access token")
+
+        expires_in = response.get("expires_in", 1800)
+
+        self._token = raw_token
+        self._expiry = time.time() + expires_in - 10
+        self._issued_tokens.add(raw_token)
+        self._refresh_count += 1
+
+        self._log("Successfully generated a token")
+        self._schedule_background_refresh(expires_in)
+
+        return raw_token
+
+    def _schedule_background_refresh(self, expires_in):
+
+        if not self.background_refresh or self._stopped:
+            return
+
+        if self._timer:
+            self._timer.cancel()
+
+        delay = max(expires_in - self.refresh_margin, expires_in / 2)
+        self._timer = threading.Timer(delay, self._background_refresh)
+        self._timer.daemon = True
+        self._timer.start()
+
+    def _background_refresh(self):
+
+        try:
+            with self._lock:
+                if not self._stopped:
+                    self._refresh()
+        except Exception as e:
+            # The next get_token() call refreshes synchronously once the current token expires
+            self._log(f"Background token refresh failed: {e}", level="warning")
+
+    def _is_valid(self):
+        return self._token is not None and time.time() < self._expiry
+
+    def get_token(self):
+        """Return a valid access token, refreshing it first if needed."""
+
+        if self._is_valid():
+            return self._token
+
+        with self._lock:
+            # Another thread may have refreshed while this one waited for the lock
+            if self._is_valid():
+                return self._token
+
+            self._log("Token expired or missing. Renewing...")
+            return self._refresh()
+
+    def owns(self, token):
+        """True if token is an access token issued by this manager."""
+        return token in self._issued_tokens
+
+    def refresh_after_unauthorized(self, rejected_token):
+        """Re-authenticate after a 401. Concurrent callers holding the same rejected token share one refresh."""
+
+        with self._lock:
+            if self._token is not None and self._token != rejected_token and self._is_valid():
+                return self._token
+
+            self._log("Request was rejected with 401. Re-authenticating...", level="warning")
+            return self._refresh()
+
+    def get_refresh_count(self):
+        return self._refresh_count
+
+    def stop(self):
+
+        with self._lock:
+            self._stopped = True
+
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
@@ -0,0 +1,164 @@
+from collections import Counter, defaultdict
+from concurrent.futures import ThreadPoolExecutor
+
+import asyncio
+import threading
+import time
+
+class WorkResult:
+    """
+    Counters and lists filled by item functions.
+
+    Every worker (thread, or asyncio task) writes to its own WorkResult, so no locking is needed
+    while items are processed; WorkExecutor merges them once all items are done.
+    """
+
+    def __init__(self):
+        self.counters = Counter()
+        self.lists = defaultdict(list)
+
+    def increment(self, name, amount=1):
+        self.counters[name] += amount
+
+    def append(self, name, value):
+        self.lists[name].append(value)
+
+    def get_count(self, name):
+        return self.counters.get(name, 0)
+
+    def get_list(self, name):
+        return self.lists.get(name, [])
+
+    def merge(self, other):
+        self.counters.update(other.counters)
+        for name, values in other.lists.items():
+            self.lists[name].extend(values)
+
+class WorkSummary(WorkResult):
+    """Merged WorkResult of a run, plus the number of items processed, items that raised, and elapsed time."""
+
+    def __init__(self):
+        super().__init__()
+        self.items = 0
+        self.errors = 0
+        self.elapsed = 0.0
+
+    def get_throughput(self):
+        return self.items / self.elapsed if self.elapsed > 0 else 0.0
+
+class WorkExecutor:
+    """
+    Runs an item function over a list of items with a selectable backend:
+    - serial:  one item after another in the calling thread
+    - thread:  a thread pool of max_workers threads
+    - asyncio: the item function is a coroutine function; at most max_workers items run at once
+
+    The item function is called as func(item, result, *args, **kwargs), where result is the
+    calling worker's own WorkResult. An exception raised by the item function is logged and
+    counted in the summary's errors; the other items keep running.
+    """
+
+    BACKENDS = ("serial", "thread", "asyncio")
+
+    def __init__(self, backend="thread", max_workers=3, logger=None):
+        if backend not in self.BACKENDS:
+            raise ValueError(f"Unknown backend {backend}, expected one of {self.BACKENDS}")
+
+        self.backend = backend
+        self.max_workers = max_workers
+        self.logger = logger
+
+    def _log(self, message, level="info"):
+        if self.logger:
+            getattr(self.logger, level)(message)
+        else:
+            print(message)
+
+    def _run_item(self, func, item, result, args, kwargs):
+        try:
+            func(item, result, *args, **kwargs)
+        except Exception as e:
+            result.increment("_errors")
+            self._log(f"Unhandled error while processing an item: {e}", level="error")
+
+    def _run_serial(self, items, func, args, kwargs):
+        result = WorkResult()
+
+        for item in items:
+            self._run_item(func, item, result, args, kwargs)
+
+        return [result]
+
+    def _run_threads(self, items, func, args, kwargs):
+        local = threading.local()
+        results = []
+
+        def worker(item):
+            result = getattr(local, "result", None)
+            if result is None:
+                # Registered once per thread; afterwards each thread only touches its own result
+                result = local.result = WorkResult()
+                results.append(result)
+
+            self._run_item(func, item, result, args, kwargs)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for _ in executor.map(worker, items):
+                pass
+
+        return results
+
+    def _run_asyncio(self, items, func, args, kwargs):
+
+        async def run_all():
+            semaphore = asyncio.Semaphore(self.max_workers)
+
+            async def run_one(item):
+                result = WorkResult()
+
+                async with semaphore:
+                    try:
+                        await func(item, result, *args, **kwargs)
+                    except Exception as e:
+                        result.increment("_errors")
+                        self._log(f"Unhandled error while processing an item: {e}", level="error")
+
+                return result
+
+            return await asyncio.gather(*[run_one(item) for item in items])
+
+        return asyncio.run(run_all())
+
+    def run(self, items, func, *args, **kwargs):
+        """Process every item and return the merged WorkSummary."""
+
+        items = list(items)
+        start = time.monotonic()
+
+        if self.backend == "serial":
+            results = self._run_serial(items, func, args, kwargs)
+        elif self.backend == "thread":
+            results = self._run_threads(items, func, args, kwargs)
+        else:
+            results = self._run_asyncio(items, func, args, kwargs)
+
+        summary = WorkSummary()
+        for result in results:
+            summary.merge(result)
+
+        summary.errors = summary.counters.pop("_errors", 0)
+        summary.items = len(items)
+        summary.elapsed = time.monotonic() - start
+
+        return summary
+
+    def log_throughput(self, summary, logger=None):
+
+        message = (f"Processed {summary.items} items in {summary.elapsed:.1f}s with the {self.backend} backend "
+                   f"({self.max_workers if self.backend != 'serial' else 1} workers): {summary.get_throughput():.2f} items/s, "
+                   f"{summary.errors} unhandled errors")
+
+        if logger or self.logger:
+            (logger or self.logger).info(message)
+        else:
+            print(message)